@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Measures process_line throughput on a busy channel capture.
+
+Compares the handler table dispatch against the previous per-line getattr dispatch.
+A capture file of raw IRC lines can be passed, otherwise one is synthesized.
+"""
+
+from zen_irc import ZenIRC
+
+from irctokens import tokenise
+from argparse import ArgumentParser
+from logging import getLogger
+from time import perf_counter
+import asyncio
+
+
+def synthesize_capture(count, channel='#busy'):
+    """ Builds a busy channel capture, mostly PRIVMSG with some NOTICE and MODE lines. """
+    lines = []
+    for i in range(count):
+        nick = "user%d" % (i % 500)
+        source = ":%s!~%s@host-%d.example.net" % (nick, nick, i % 500)
+        if i % 50 == 0:
+            lines.append("%s NOTICE %s :notice number %d" % (source, channel, i))
+        elif i % 97 == 0:
+            lines.append("%s MODE %s +v %s" % (source, channel, nick))
+        else:
+            lines.append("%s PRIVMSG %s :message %d with some typical chat text in it" % (source, channel, i))
+    return lines
+
+
+async def legacy_process_line(client, line):
+    """ The getattr based process_line which the handler table replaced. """
+    client.logger.debug('Processing line: %s' % line)
+    if handler := getattr(client, f'handle_{line.command}', None):
+        handler(line)
+    else:
+        client.logger.warning('[%s] Unhandled line: %s' % (line.command, line))
+
+    if line.command in ['QUIT']:
+        client.stop()
+
+
+async def run(process, lines, rounds):
+    start = perf_counter()
+    for _ in range(rounds):
+        for line in lines:
+            await process(line)
+    return len(lines) * rounds / (perf_counter() - start)
+
+
+def main():
+    parser = ArgumentParser(description="Handler dispatch benchmark")
+    parser.add_argument('capture', nargs='?', help='File containing raw IRC lines')
+    parser.add_argument('-n', '--lines', type=int, default=100000, help='Number of lines to synthesize')
+    parser.add_argument('-r', '--rounds', type=int, default=5, help='Number of times to replay the capture')
+    args = parser.parse_args()
+
+    if args.capture:
+        with open(args.capture, 'rb') as f:
+            raw_lines = [line.rstrip(b'\r\n') for line in f if line.strip()]
+    else:
+        raw_lines = synthesize_capture(args.lines)
+    lines = [tokenise(line) for line in raw_lines]
+
+    logger = getLogger('bench_dispatch')
+    logger.setLevel(30)
+    client = ZenIRC(config={'server': 'bench.invalid', 'port': 6697, 'user': 'bench'}, logger=logger)
+    client.process_message = lambda msg: None
+
+    results = {}
+    for name, process in (('getattr', lambda line: legacy_process_line(client, line)),
+                          ('table', client.process_line)):
+        results[name] = asyncio.run(run(process, lines, args.rounds))
+        print("%-8s %12.0f lines/sec" % (name, results[name]))
+
+    print("speedup  %12.2fx" % (results['table'] / results['getattr']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Measures the time per GUI update while feeding synthetic PRIVMSGs into a scrollback.
+
+Compares ScrollbackView, which appends only new entries once per frame,
+against rebuilding a QLabel from the whole scrollback on every message.
+Runs with the offscreen Qt platform unless QT_QPA_PLATFORM is set.
+"""
+
+from os import environ
+environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from zen_irc.scrollback import Scrollback
+from zen_irc.zenircgui import ScrollbackView
+
+from PyQt6.QtWidgets import QApplication, QLabel
+from argparse import ArgumentParser
+from time import perf_counter
+
+
+def bench_view(messages, per_frame, size):
+    """ Appends messages, updating the view once every per_frame messages. """
+    scrollback = Scrollback(size)
+    view = ScrollbackView(size)
+    elapsed, updates = 0.0, 0
+    for i in range(messages):
+        scrollback.append("user%d" % (i % 200), "synthetic message number %d" % i)
+        if i % per_frame == per_frame - 1:
+            start = perf_counter()
+            view.show_scrollback(scrollback)
+            elapsed += perf_counter() - start
+            updates += 1
+    return elapsed, updates
+
+
+def bench_label(messages, size):
+    """ Rebuilds a QLabel from the whole scrollback on every message, as the GUI used to. """
+    scrollback = Scrollback(size)
+    label = QLabel()
+    label.setWordWrap(True)
+    elapsed = 0.0
+    for i in range(messages):
+        scrollback.append("user%d" % (i % 200), "synthetic message number %d" % i)
+        start = perf_counter()
+        label_text = ''
+        for entry in scrollback:
+            label_text += f"{entry.nick}: {entry.text}\n"
+        label.setText(label_text)
+        elapsed += perf_counter() - start
+    return elapsed, messages
+
+
+def main():
+    parser = ArgumentParser(description="GUI update benchmark")
+    parser.add_argument('-n', '--messages', type=int, default=100000, help='PRIVMSGs to feed')
+    parser.add_argument('-f', '--per-frame', type=int, default=50, help='Messages arriving per coalesced update')
+    parser.add_argument('-s', '--scrollback', type=int, default=1000, help='Scrollback size')
+    parser.add_argument('--label-messages', type=int, default=5000, help='PRIVMSGs to feed the QLabel rebuild')
+    args = parser.parse_args()
+
+    app = QApplication([])  # Referenced until the end so it outlives the widgets being benchmarked
+    for name, (elapsed, updates), messages in (
+            ('view', bench_view(args.messages, args.per_frame, args.scrollback), args.messages),
+            ('label', bench_label(args.label_messages, args.scrollback), args.label_messages)):
+        print("%-6s %8d msgs %8d updates %10.3f ms/update %10.1f us/msg" % (
+            name, messages, updates, elapsed / updates * 1e3, elapsed / messages * 1e6))
+    app.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Measures import time of the library and the CLI entry point.
+
+Each import runs in a fresh interpreter with -X importtime, best of several runs,
+less the imports of interpreter startup. Fails if Qt is loaded or an import takes longer than --max-ms.
+"""
+
+from argparse import ArgumentParser
+from subprocess import run
+import sys
+
+
+TARGETS = {
+    'zen_irc': 'import zen_irc',
+    'zen_irc.ZenIRC': 'import zen_irc; zen_irc.ZenIRC',
+    'zen_irc.client': 'import zen_irc.client',
+}
+
+
+def import_times(code):
+    """
+    Runs code in a new interpreter with -X importtime.
+    Returns the total import time in microseconds, and {module: self time in microseconds}.
+    """
+    result = run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True)
+    total, times = 0, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative, module = line[len('import time:'):].split('|')
+        if not module[1:].startswith(' '):  # Imported directly by code, not by another module
+            total += int(cumulative)
+        times[module.strip()] = int(self_time)
+    return total, times
+
+
+def main():
+    parser = ArgumentParser(description="Import time benchmark")
+    parser.add_argument('-r', '--runs', type=int, default=5, help='Runs per target, the fastest is reported')
+    parser.add_argument('-t', '--top', type=int, default=8, help='Modules with the slowest own import time to list per target')
+    parser.add_argument('--max-ms', type=float, help='Fail if any target takes longer than this')
+    args = parser.parse_args()
+
+    baseline = min(import_times('pass')[0] for _ in range(args.runs))  # Interpreter startup imports
+    failed = False
+    for name, code in TARGETS.items():
+        total, times = min((import_times(code) for _ in range(args.runs)), key=lambda result: result[0])
+        total -= baseline
+        print("%-16s %8.1f ms" % (name, total / 1000))
+        for self_time, module in sorted(((self_time, module) for module, self_time in times.items()), reverse=True)[:args.top]:
+            print("    %-32s %8.1f ms" % (module, self_time / 1000))
+        if qt := [module for module in times if module.startswith('PyQt6')]:
+            print("    Qt was imported: %s" % ", ".join(qt[:3]))
+            failed = True
+        if args.max_ms and total / 1000 > args.max_ms:
+            failed = True
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Measures MembershipIndex memory use and update rates.
+
+Fills channels from NAMES entries until the requested number of memberships exists,
+then times PART, QUIT and NICK updates against it.
+"""
+
+from zen_irc.members import MembershipIndex
+
+from argparse import ArgumentParser
+from time import perf_counter
+import tracemalloc
+
+
+def names_entries(channel_index, users, population):
+    """ Returns NAMES entries for a channel, overlapping members with neighbouring channels. """
+    start = channel_index * users // 2
+    return ["%sUser[%d]" % ('@' if i % 25 == 0 else '', i % population) for i in range(start, start + users)]
+
+
+def main():
+    parser = ArgumentParser(description="Membership index benchmark")
+    parser.add_argument('-m', '--memberships', type=int, default=100000, help='Total memberships to index')
+    parser.add_argument('-u', '--users', type=int, default=10000, help='Users per channel')
+    args = parser.parse_args()
+
+    channels = max(args.memberships // args.users, 1)
+    population = channels * args.users // 2 + args.users
+    entries = {"#Channel%d" % i: names_entries(i, args.users, population) for i in range(channels)}
+
+    tracemalloc.start()
+    index = MembershipIndex()
+    start = perf_counter()
+    for channel, names in entries.items():
+        index.add_names(channel, names)
+    elapsed = perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("%d memberships, %d nicks, %d channels" % (len(index), len(index.nicks), len(index.channels)))
+    print("memory: %.2f MB (%.1f bytes/membership)" % (memory / 1e6, memory / len(index)))
+    print("NAMES:  %10.0f entries/sec" % (len(index) / elapsed))
+
+    nicks = ["user[%d]" % i for i in range(0, population, 3)]
+    start = perf_counter()
+    for nick in nicks:
+        index.rename(nick, nick + "_")
+    print("NICK:   %10.0f updates/sec" % (len(nicks) / (perf_counter() - start)))
+
+    start = perf_counter()
+    for i, nick in enumerate(nicks):
+        index.remove("#Channel%d" % (i % channels), nick + "_")
+    print("PART:   %10.0f updates/sec" % (len(nicks) / (perf_counter() - start)))
+
+    start = perf_counter()
+    for nick in nicks:
+        index.quit(nick + "_")
+    print("QUIT:   %10.0f updates/sec" % (len(nicks) / (perf_counter() - start)))
+    print("%d memberships remaining" % len(index))
+
+
+if __name__ == "__main__":
+    main()
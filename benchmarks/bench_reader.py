@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Measures line splitting and tokenising throughput on a connect burst.
+
+Compares fixed 1024 byte reads through irctokens' StatefulDecoder against
+adaptive reads through LineBuffer. A recorded burst of raw IRC data can be passed,
+otherwise one is synthesized with 005, MOTD, NAMES and QUIT lines.
+"""
+
+from zen_irc.linebuffer import LineBuffer
+
+from irctokens import StatefulDecoder, tokenise
+from argparse import ArgumentParser
+from time import perf_counter
+import tracemalloc
+
+
+def synthesize_burst(users, motd_lines=200, server='irc.example.net', nick='bench'):
+    """ Builds the data a server sends on connect, then a netsplit of users. """
+    lines = [":%s 001 %s :Welcome to the Example IRC Network %s" % (server, nick, nick)]
+    for i in range(12):
+        lines.append(":%s 005 %s CHANTYPES=# PREFIX=(ov)@+ CASEMAPPING=rfc1459 TOKEN%d=%d"
+                     " NETWORK=Example :are supported by this server" % (server, nick, i, i))
+    lines.append(":%s 375 %s :- %s Message of the Day -" % (server, nick, server))
+    lines += [":%s 372 %s :- motd line %d, with a bit of filler text" % (server, nick, i) for i in range(motd_lines)]
+    lines.append(":%s 376 %s :End of /MOTD command." % (server, nick))
+
+    names = ["%suser%d" % ('@' if i % 20 == 0 else '', i) for i in range(users)]
+    for i in range(0, users, 40):
+        lines.append(":%s 353 %s = #big :%s" % (server, nick, " ".join(names[i:i + 40])))
+    lines.append(":%s 366 %s #big :End of /NAMES list." % (server, nick))
+    lines += [":user%d!~user%d@host.example.net QUIT :*.net *.split" % (i, i) for i in range(users)]
+    return ("\r\n".join(lines) + "\r\n").encode()
+
+
+def read_fixed(data, size=1024):
+    """ Yields data in reads of a fixed size. """
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def decoder_lines(data):
+    decoder = StatefulDecoder()
+    count = 0
+    for chunk in read_fixed(data):
+        count += len(decoder.push(chunk))
+    return count
+
+
+def linebuffer_lines(data):
+    line_buffer = LineBuffer()
+    count, offset = 0, 0
+    while offset < len(data):
+        chunk = data[offset:offset + line_buffer.read_size]
+        offset += len(chunk)
+        line_buffer.adapt(len(chunk))
+        for raw_line in line_buffer.push(chunk):
+            tokenise(raw_line)
+            count += 1
+    return count
+
+
+def measure(func, data):
+    start = perf_counter()
+    count = func(data)
+    elapsed = perf_counter() - start
+
+    tracemalloc.start()
+    func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, len(data) / elapsed / 1e6, peak / count
+
+
+def main():
+    parser = ArgumentParser(description="Reader benchmark")
+    parser.add_argument('capture', nargs='?', help='File containing raw IRC data')
+    parser.add_argument('-u', '--users', type=int, default=50000, help='Users in the synthesized NAMES list and netsplit')
+    args = parser.parse_args()
+
+    if args.capture:
+        with open(args.capture, 'rb') as f:
+            data = f.read()
+    else:
+        data = synthesize_burst(args.users)
+
+    print("%.2f MB burst" % (len(data) / 1e6))
+    print("%-12s %10s %10s %16s" % ('reader', 'lines', 'MB/s', 'peak bytes/line'))
+    for name, func in (('decoder', decoder_lines), ('linebuffer', linebuffer_lines)):
+        print("%-12s %10d %10.2f %16.1f" % (name, *measure(func, data)))
+
+
+if __name__ == "__main__":
+    main()
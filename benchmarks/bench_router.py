@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Measures PRIVMSG routing cost as the number of registered triggers grows.
+
+Compares a chain of startswith and regex checks, as bots overriding process_message do,
+against the Router's prefix trie and combined regex.
+"""
+
+from zen_irc.router import Router
+
+from argparse import ArgumentParser
+from re import compile
+from time import perf_counter
+
+
+class Message:
+    """ Stands in for a tokenised PRIVMSG. """
+    __slots__ = ('source', 'params')
+
+    def __init__(self, text, channel='#bench', source='nick!user@host.example.net'):
+        self.source = source
+        self.params = [channel, text]
+
+
+def build_triggers(count):
+    """ Returns command names and regexes for count triggers, half of each. """
+    commands = ["command%d" % i for i in range(count // 2)]
+    regexes = [r"\bkeyword%d\b" % i for i in range(count - count // 2)]
+    return commands, regexes
+
+
+def chained(commands, regexes):
+    compiled = [compile(regex) for regex in regexes]
+
+    def route(msg):
+        text = msg.params[1]
+        for command in commands:
+            if text.startswith('!' + command) and (len(text) == len(command) + 1 or text[len(command) + 1] == ' '):
+                return 1
+        for pattern in compiled:
+            if pattern.search(text):
+                return 1
+        return 0
+    return route
+
+
+def routed(commands, regexes):
+    router = Router()
+    for command in commands:
+        router.add(lambda msg, args: None, command=command)
+    for regex in regexes:
+        router.add(lambda msg, match: None, regex=regex)
+    return router.route
+
+
+def measure(route, messages, rounds):
+    start = perf_counter()
+    for _ in range(rounds):
+        for msg in messages:
+            route(msg)
+    return len(messages) * rounds / (perf_counter() - start)
+
+
+def main():
+    parser = ArgumentParser(description="PRIVMSG routing benchmark")
+    parser.add_argument('-t', '--triggers', type=int, nargs='+', default=[10, 100, 1000], help='Trigger counts to compare')
+    parser.add_argument('-r', '--rounds', type=int, default=20, help='Times to route the message set')
+    args = parser.parse_args()
+
+    for count in args.triggers:
+        commands, regexes = build_triggers(count)
+        messages = [Message("just chatting about nothing in particular, message %d" % i) for i in range(500)]
+        messages += [Message("!%s with some arguments" % commands[i % len(commands)]) for i in range(250)]
+        messages += [Message("something about keyword%d here" % (i % len(regexes))) for i in range(250)]
+        print("%5d triggers: chained %10.0f msgs/sec, router %10.0f msgs/sec" % (
+            count, measure(chained(commands, regexes), messages, args.rounds),
+            measure(routed(commands, regexes), messages, args.rounds)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,26 @@
-from .zenirc import ZenIRC
+"""
+Submodules are imported when their names are first used, so importing zen_irc stays cheap.
+"""
 
-__all__ = ['ZenIRC']
+_EXPORTS = {
+    'ZenIRC': '.zenirc',
+    'ZenIRCManager': '.zenircmanager',
+    'handler': '.handlerregistry',
+    'route': '.router',
+    'SubscriptionOverflow': '.subscriptions',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    from importlib import import_module
+    value = getattr(import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -8,15 +8,29 @@ class BaseIRCHandlers:
         """ Respond to PING messages. """
         self.pong(msg.params[0])
 
+    def handle_PONG(self, msg):
+        """ Handle PONG messages, replies to keepalive PINGs. """
+        self.logger.debug("[%s] PONG: %s" % (msg.source, msg.params[-1] if msg.params else ''))
+
     def handle_JOIN(self, msg):
         """ Handle JOIN messages. """
         self.logger.info("[%s] Joined channel: %s." % (msg.source, msg.params[0]))
-        self.channels[msg.params[0]]['joined'].set()
+        self.members.add(msg.params[0], msg.hostmask.nickname)
+        if self.members.fold(msg.hostmask.nickname) == self.members.fold(self.nickname):
+            self.userhost = msg.source.partition('!')[2] or self.userhost
+            if msg.params[0] in self.channels:
+                channel = self.channels[msg.params[0]]
+                channel['joined'].set()
+                for message in channel.pop('pending', ()):
+                    self.msg(msg.params[0], message)
 
     def handle_NICK(self, msg):
         """ Handle NICK messages. """
         if msg.params[0] == self.nickname:
             self.logger.debug("Server registered nickname: %s." % msg.params[0])
+        elif msg.hostmask.nickname == self.nickname:
+            self.nickname = msg.params[0]
+        self.members.rename(msg.hostmask.nickname, msg.params[0])
         self.logger.info("[%s] Changed nick to: %s." % (msg.source, msg.params[0]))
 
     def handle_NOTICE(self, msg):
@@ -24,14 +38,25 @@ class BaseIRCHandlers:
         self.logger.info("[%s] NOTICE: %s." % (msg.source, msg.params[1]))
 
     def handle_MODE(self, msg):
-        """ Handle MODE messages. """
+        """ Handle MODE messages. Channel modes such as +o and +v update the members' modes. """
+        if msg.params[0][:1] in self.isupport.chantypes:
+            self.logger.info("[%s] Set mode on %s: %s" % (msg.source, msg.params[0], ' '.join(msg.params[1:])))
+            prefix_modes = self.isupport.prefix.values()
+            for adding, mode, param in self.isupport.parse_modes(msg.params[1], msg.params[2:]):
+                if mode in prefix_modes and param:
+                    self.members.set_mode(msg.params[0], param, mode, adding)
+            return
         self.logger.info("[%s] Your mode is: %s" % (msg.source, msg.params[1]))
         self.mode = msg.params[1]
 
     def handle_PRIVMSG(self, msg):
         """ Handle PRIVMSG messages. """
         self.logger.info("[%s] %s : %s" % (msg.params[0], msg.source, msg.params[1]))
-        self.message_queue.put(msg)
+        if msg.source and self.members.fold(msg.hostmask.nickname) == self.members.fold(self.nickname):
+            return self.process_echo(msg)
+        if self.router.count:
+            self.router.route(msg)
+        self.publish_message(msg)
 
     def handle_PART(self, msg):
         """ Handle PART messages. """
@@ -39,15 +64,28 @@ class BaseIRCHandlers:
             self.logger.info("[%s] User parted channel: %s (%s)" % (msg.source, msg.params[0], msg.params[1]))
         else:
             self.logger.info("[%s] User parted channel: %s" % (msg.source, msg.params[0]))
-        if msg.hostmask.nickname != self.nickname:
-            self.channels[msg.params[0]]['users'].remove(msg.source)
+        if self.members.fold(msg.hostmask.nickname) != self.members.fold(self.nickname):
+            self.members.remove(msg.params[0], msg.hostmask.nickname)
+        else:
+            self.members.remove_channel(msg.params[0])
+
+    def handle_KICK(self, msg):
+        """ Handle KICK messages. """
+        self.logger.info("[%s] Kicked %s from %s: %s" % (msg.source, msg.params[1], msg.params[0], msg.params[-1]))
+        if self.members.fold(msg.params[1]) != self.members.fold(self.nickname):
+            self.members.remove(msg.params[0], msg.params[1])
+            return
+        self.members.remove_channel(msg.params[0])
+        if channel := self.channels.get(msg.params[0]):
+            channel['joined'].clear()
+            self._channels[msg.params[0]] = self.channels.pop(msg.params[0])
 
     def handle_QUIT(self, msg):
         """ Handle QUIT messages. """
-        self.logger.info("[%s] Quit: %s." % (msg.source, msg.params[0]))
-        self.running.clear()
+        self.logger.info("[%s] Quit: %s." % (msg.source, msg.params[0] if msg.params else ''))
+        self.members.quit(msg.hostmask.nickname)
+        self.away_nicks.discard(self.members.fold(msg.hostmask.nickname))
 
     def handle_ERROR(self, msg):
         """ Handle ERROR messages. """
         self.logger.error("[%s] Error: %s." % (msg.source, msg.params[0]))
-        self.running.clear()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Load tests ZenIRC against a local FakeIRCServer.
+
+The server runs in its own process, so CPU time and RSS are those of the clients.
+Clients connect at once, join the channels, then receive messages for the duration.
+Reports time to joined and ready, lines/sec, p99 handler latency, CPU time and peak RSS,
+and can compare them against a previous run to catch regressions.
+"""
+
+from .zenirc import ZenIRC
+from .fakeserver import FakeIRCServer
+from .metrics import Histogram
+
+from argparse import ArgumentParser
+from json import dump, load
+from logging import getLogger, StreamHandler
+from multiprocessing import Process, Queue
+from time import monotonic, process_time
+import asyncio
+
+
+class BenchClient(ZenIRC):
+    """ A client which discards messages instead of printing them. """
+    def process_message(self, msg):
+        pass
+
+
+def peak_rss_mb():
+    """ Returns the peak RSS of this process in MiB, or None where the resource module is unavailable, such as on Windows. """
+    try:
+        from resource import getrusage, RUSAGE_SELF
+    except ImportError:
+        return None
+    return getrusage(RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_server(port_queue, server_args):
+    """ Runs a FakeIRCServer until the process is terminated, putting its port on port_queue. """
+    async def serve():
+        async with FakeIRCServer(**server_args) as server:
+            port_queue.put(server.port)
+            await asyncio.Event().wait()
+    asyncio.run(serve())
+
+
+async def drive_clients(host, port, clients=10, channels=5, duration=10, logger=None):
+    """ Connects clients to the server at once, then measures them for duration seconds once all are ready. """
+    sessions = [BenchClient(config={'server': host, 'port': port, 'ssl': False, 'user': 'bench%d' % index,
+                                    'channels': ['#bench%d' % channel for channel in range(channels)],
+                                    'metrics': True, 'reconnect': False, 'flood_rate': 0},
+                            logger=logger) for index in range(clients)]
+    start = monotonic()
+    tasks = [asyncio.create_task(session.start()) for session in sessions]
+    await asyncio.wait_for(asyncio.gather(*(session.ready.wait() for session in sessions)), 60)
+    ready_time = monotonic() - start
+
+    lines_start, cpu_start, measure_start = sum(session.lines_received for session in sessions), process_time(), monotonic()
+    await asyncio.sleep(duration)
+    lines = sum(session.lines_received for session in sessions) - lines_start
+    elapsed, cpu = monotonic() - measure_start, process_time() - cpu_start
+
+    for session in sessions:
+        session.stop()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    handler_time = Histogram()
+    for session in sessions:
+        for histogram in session.metrics.histograms.get('handler_seconds', {}).values():
+            handler_time.merge(histogram)
+
+    return {'clients': clients, 'channels': channels, 'duration': elapsed,
+            'ready_seconds': ready_time,
+            'lines_per_second': lines / elapsed,
+            'handler_p99_seconds': handler_time.percentile(0.99),
+            'cpu_seconds': cpu,
+            'cpu_percent': 100 * cpu / elapsed,
+            'rss_peak_mb': peak_rss_mb()}
+
+
+def benchmark(clients=10, channels=5, users=100, rate=1000, duration=10, replay=None, logger=None):
+    """ Starts a FakeIRCServer process, drives clients through it, and returns the results. """
+    port_queue = Queue()
+    server = Process(target=run_server, args=(port_queue, {'users': users, 'rate': rate, 'replay': replay}), daemon=True)
+    server.start()
+    try:
+        port = port_queue.get(timeout=10)
+        return asyncio.run(drive_clients('127.0.0.1', port, clients, channels, duration, logger))
+    finally:
+        server.terminate()
+        server.join()
+
+
+def compare(results, baseline, tolerance):
+    """ Returns a list of regressions in results compared to a baseline, beyond a tolerance fraction. """
+    regressions = []
+    if results['lines_per_second'] < baseline['lines_per_second'] * (1 - tolerance):
+        regressions.append("lines/sec dropped from %.0f to %.0f" % (baseline['lines_per_second'], results['lines_per_second']))
+    for key in ('handler_p99_seconds', 'ready_seconds', 'rss_peak_mb'):
+        if baseline.get(key) and results.get(key) and results[key] > baseline[key] * (1 + tolerance):
+            regressions.append("%s rose from %.6g to %.6g" % (key, baseline[key], results[key]))
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(prog="zen_irc_bench", description="Zen IRC load test against a local fake server")
+    parser.add_argument('-n', '--clients', type=int, default=10, help='Clients connecting at once')
+    parser.add_argument('--channels', type=int, default=5, help='Channels joined by each client')
+    parser.add_argument('--users', type=int, default=100, help='Users in each channel')
+    parser.add_argument('--rate', type=int, default=1000, help='Messages per second sent to each client, 0 for as fast as possible')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to measure for')
+    parser.add_argument('--replay', type=str, help='Recorded session to replay instead of generating messages')
+    parser.add_argument('-o', '--output', type=str, help='Write the results to a JSON file')
+    parser.add_argument('--baseline', type=str, help='Compare against the results of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed regression against the baseline, as a fraction')
+    parser.add_argument('-d', '--debug', action='store_true', help='Log client warnings and info')
+    args = parser.parse_args()
+
+    logger = getLogger('ZenIRCBench')
+    logger.setLevel(20 if args.debug else 40)
+    logger.addHandler(StreamHandler())
+
+    results = benchmark(args.clients, args.channels, args.users, args.rate, args.duration, args.replay, logger)
+    print("Clients: %(clients)d, channels: %(channels)d, ready in %(ready_seconds).3fs" % results)
+    print("Lines/sec: %(lines_per_second).0f, handler p99: %(handler_p99_seconds).6fs" % results)
+    print("CPU: %(cpu_seconds).2fs (%(cpu_percent).0f%%)" % results
+          + (", peak RSS: %.1fMiB" % results['rss_peak_mb'] if results['rss_peak_mb'] is not None else ""))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, load(f), args.tolerance)
+        for regression in regressions:
+            print("Regression: %s" % regression)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,8 @@
 
 
 from .zenircclient import ZenIRCClient
-from .zenircgui import ZenIRCGUI
 from zenlib.logging import ColorLognameFormatter
 
-from PyQt6.QtWidgets import QApplication
 from argparse import ArgumentParser
 from logging import getLogger, StreamHandler
 from asyncio import run as run_asyncio
@@ -41,6 +39,20 @@ def get_logger(args):
     return logger
 
 
+def run_gui(kwargs):
+    """ Runs the GUI, Qt is only imported here so the CLI and library never load it. """
+    try:
+        from PyQt6.QtWidgets import QApplication
+        from .zenircgui import ZenIRCGUI
+    except ImportError as e:
+        raise SystemExit("The GUI requires PyQt6, install zen_irc[gui] or run with --cli: %s" % e)
+
+    app = QApplication([])
+    gui = ZenIRCGUI(**kwargs)
+    gui.start_client()
+    app.exec()
+
+
 def main():
     args = parse_args()
     logger = get_logger(args)
@@ -52,12 +64,9 @@ def main():
 
     if args.cli:
         client = ZenIRCClient(**kwargs)
-        run_asyncio(client.start())
+        return run_asyncio(client.start())
 
-    app = QApplication([])
-    gui = ZenIRCGUI(**kwargs)
-    run_asyncio(gui.client.start())
-    app.exec()
+    run_gui(kwargs)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,74 @@
+"""
+Runs offloaded handlers off the reader task, in order per channel.
+"""
+
+from collections import deque
+import asyncio
+
+
+class OrderedExecutor:
+    """
+    Runs handler calls in order per key, while calls for different keys run concurrently.
+    Each key with pending calls has a lane, a deque drained by its own task, which ends when the lane is empty.
+    async handlers are awaited in the lane, thread and process handlers are awaited in their pools.
+    """
+    def __init__(self, logger, threads=None, processes=None):
+        self.logger = logger
+        self.threads = threads
+        self.processes = processes
+        self.thread_pool = None
+        self.process_pool = None
+        self.lanes = {}  # key: deque of (mode, func, msg)
+        self.tasks = {}  # key: lane task
+
+    def __len__(self):
+        """ Returns the number of calls waiting or running. """
+        return sum(len(lane) for lane in self.lanes.values())
+
+    def submit(self, key, mode, func, msg):
+        """ Queues a handler call in the lane for key, must be called from the event loop. """
+        if (lane := self.lanes.get(key)) is None:
+            lane = self.lanes[key] = deque()
+            lane.append((mode, func, msg))
+            self.tasks[key] = asyncio.get_running_loop().create_task(self.run_lane(key, lane))
+        else:
+            lane.append((mode, func, msg))
+
+    async def run_lane(self, key, lane):
+        """ Runs the calls in a lane in order, removing the lane once it is empty. """
+        try:
+            while lane:
+                mode, func, msg = lane[0]
+                try:
+                    await self.run(mode, func, msg)
+                except Exception as e:
+                    self.logger.exception("[%s] %s handler %s failed: %s" % (msg.command, mode, func, e))
+                lane.popleft()
+        finally:
+            del self.lanes[key]
+            del self.tasks[key]
+
+    async def run(self, mode, func, msg):
+        if mode == 'async':
+            return await func(msg)
+        loop = asyncio.get_running_loop()
+        if mode == 'thread':
+            if self.thread_pool is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self.thread_pool = ThreadPoolExecutor(self.threads, thread_name_prefix='zen_irc_handler')
+            return await loop.run_in_executor(self.thread_pool, func, msg)
+        if mode == 'process':
+            if self.process_pool is None:
+                from concurrent.futures import ProcessPoolExecutor  # Loads multiprocessing, so only when used
+                self.process_pool = ProcessPoolExecutor(self.processes)
+            return await loop.run_in_executor(self.process_pool, func, msg)
+        raise ValueError("Unknown handler mode: %s" % mode)
+
+    def shutdown(self):
+        """ Cancels pending calls and shuts down the pools, without waiting for running calls. """
+        for task in list(self.tasks.values()):
+            task.cancel()
+        for pool in (self.thread_pool, self.process_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self.thread_pool = self.process_pool = None
@@ -2,12 +2,15 @@
 Handlers for IRC events.
 """
 
+from .handlerregistry import handler
+
 
 class ExtendedIRCHandlers:
     def handle_001(self, msg):
         """ Handle 001 messages. """
         self.logger.info("[%s] Welcome message: %s." % (msg.source, msg.params[1]))
         self.server_info["welcome_message"] = msg.params[1]
+        self.on_registered()
 
     def handle_002(self, msg):
         """ Handle 002 messages. """
@@ -27,7 +30,9 @@ class ExtendedIRCHandlers:
         """ Handle 005 messages. """
         supported_features = msg.params[1:-1]
         self.logger.debug("[%s] Supported features: %s." % (msg.source, " ".join(supported_features)))
-        self.server_info["supported_features"] += supported_features
+        self.isupport.update(supported_features)
+        self.members.set_prefix(self.isupport.prefix)
+        self.members.set_casemapping(self.isupport.casemapping)
 
     def handle_250(self, msg):
         """ Handle 250 messages. """
@@ -91,16 +96,17 @@ class ExtendedIRCHandlers:
         """ Handle 353 messages. """
         channel = msg.params[2]
         users = msg.params[3].split(" ")
-        self.logger.debug("[%s] Users in channel %s: %s" % (msg.source, channel, " ".join(users)))
-        if 'users' not in self.channels[channel]:
-            self.channels[channel]['users'] = users
-        else:
-            self.channels[channel]['users'] += users
+        if self.logger.isEnabledFor(10):
+            self.logger.debug("[%s] Users in channel %s: %s", msg.source, channel, msg.params[3])
+        if (folded_channel := self.members.fold(channel)) in self.names_stale:
+            self.names_stale.discard(folded_channel)  # Replace members restored from the session cache
+            self.members.remove_channel(channel)
+        self.members.add_names(channel, users)
 
     def handle_366(self, msg):
         """ Handle 366 messages. """
-        self.logger.info("[%s] Users in %s: %s" % (msg.source, msg.params[1],
-                                                   " ".join(self.channels[msg.params[1]]['users'])))
+        self.logger.info("[%s] Users in %s: %d" % (msg.source, msg.params[1], len(self.members.members(msg.params[1]))))
+        self.channel_ready(msg.params[1])
 
     def handle_375(self, msg):
         """ Handle 375 messages. """
@@ -120,14 +126,20 @@ class ExtendedIRCHandlers:
         self.logger.debug("[%s] MOTD: %s" % (msg.source, msg.params[1]))
 
     def handle_376(self, msg):
-        """ Handle 376 messages. """
+        """ Handle 376 messages, the MOTD is only logged in full if it changed since it was cached. """
         self.motd_start.clear()
+        if self.server_info["motd"] == self.cached_session.get('server_info', {}).get('motd'):
+            self.logger.info("[%s] MOTD unchanged since the last session." % msg.source)
+            return
         self.logger.info("[%s] MOTD: %s\n%s" % (msg.source, self.server_info["motd_header"],
                                                 "\n".join(self.server_info["motd"])))
 
+    @handler('471', '473', '474', '475')
     def handle_477(self, msg):
-        """ Handle 477 messages. """
+        """ Handle 477 messages, and the other JOIN failures. """
         self.logger.warning("[%s(%s)] %s" % (msg.source, msg.params[1], msg.params[2]))
-        self.channels[msg.params[1]]['failed'] = True
+        if msg.params[1] in self.channels:
+            self.channels[msg.params[1]]['failed'] = True
+        self.channel_ready(msg.params[1])
 
 
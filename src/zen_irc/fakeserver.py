@@ -0,0 +1,219 @@
+"""
+A local stand-in for an IRC server, for load tests and benchmarks.
+"""
+
+from irctokens import tokenise
+
+from .recorder import RecordingReader, INCOMING
+
+from pathlib import Path
+from time import monotonic
+import asyncio
+
+
+class FakeIRCServer:
+    """
+    Accepts plain TCP connections, registers clients and answers CAP, JOIN, PART, PING and QUIT.
+    Each joined channel gets a NAMES reply of users synthetic users, and once a client has joined,
+    PRIVMSGs from those users are sent at rate messages per second, or as fast as the client reads if rate is 0.
+    If replay is set, the lines of that file are sent instead, see replay_lines.
+    """
+    def __init__(self, host='127.0.0.1', port=0, users=100, rate=100, ping_interval=0, replay=None, replay_speed=1.0,
+                 server_name='fake.irc', capabilities=('multi-prefix', 'server-time', 'batch', 'away-notify')):
+        self.host = host
+        self.port = port
+        self.users = users
+        self.rate = rate
+        self.ping_interval = ping_interval
+        self.replay = replay
+        self.replay_speed = replay_speed
+        self.server_name = server_name
+        self.capabilities = capabilities
+        self.server = None
+        self.connections = set()
+        self.lines_sent = 0
+        self.lines_received = 0
+
+    async def start(self):
+        """ Starts listening, port 0 picks a free port which is then set on self.port. """
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        for task in list(self.connections):
+            task.cancel()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    def write(self, writer, lines):
+        """ Writes lines to a client in one write. """
+        self.lines_sent += len(lines)
+        writer.write(''.join(line + '\r\n' for line in lines).encode())
+
+    async def handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections.add(task)
+        client = {'nick': None, 'user': None, 'cap': False, 'registered': False, 'channels': []}
+        tasks = []
+        try:
+            while line := await reader.readline():
+                if not (line := line.rstrip(b'\r\n')):
+                    continue  # Blank lines are ignored, as servers do
+                self.lines_received += 1
+                msg = tokenise(line)
+                if reply := getattr(self, 'on_' + msg.command, None):
+                    reply(writer, client, msg)
+                if not client['registered'] and client['nick'] and client['user'] and not client['cap']:
+                    client['registered'] = True
+                    self.register(writer, client)
+                    if self.ping_interval:
+                        tasks.append(asyncio.create_task(self.ping_loop(writer)))
+                    if self.replay:
+                        tasks.append(asyncio.create_task(self.replay_loop(writer, client)))
+                if msg.command == 'JOIN' and not self.replay and not client.get('loader'):
+                    client['loader'] = True
+                    tasks.append(asyncio.create_task(self.message_loop(writer, client)))
+                if msg.command == 'QUIT':
+                    break
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            for client_task in tasks:
+                client_task.cancel()
+            writer.close()
+            self.connections.discard(task)
+
+    def register(self, writer, client):
+        """ Sends the registration burst, with a short MOTD. """
+        nick, server = client['nick'], self.server_name
+        self.write(writer, [
+            ":%s 001 %s :Welcome to the fake network %s" % (server, nick, nick),
+            ":%s 002 %s :Your host is %s" % (server, nick, server),
+            ":%s 003 %s :This server was created today" % (server, nick),
+            ":%s 004 %s %s fake-1.0 iowx bklmnopstv" % (server, nick, server),
+            ":%s 005 %s CHANTYPES=# PREFIX=(ov)@+ CASEMAPPING=rfc1459 TARGMAX=JOIN:,PART:,PRIVMSG:4,NOTICE:4 "
+            "NETWORK=Fake :are supported by this server" % (server, nick),
+            ":%s 375 %s :- %s Message of the day -" % (server, nick, server),
+            ":%s 372 %s :- This is a fake server for benchmarks." % (server, nick),
+            ":%s 376 %s :End of /MOTD command." % (server, nick)])
+
+    def on_CAP(self, writer, client, msg):
+        subcommand = msg.params[0].upper()
+        if subcommand == 'LS':
+            client['cap'] = True
+            self.write(writer, [":%s CAP * LS :%s" % (self.server_name, " ".join(self.capabilities))])
+        elif subcommand == 'REQ':
+            self.write(writer, [":%s CAP * ACK :%s" % (self.server_name, msg.params[-1])])
+        elif subcommand == 'END':
+            client['cap'] = False
+
+    def on_NICK(self, writer, client, msg):
+        client['nick'] = msg.params[0]
+
+    def on_USER(self, writer, client, msg):
+        client['user'] = msg.params[0]
+
+    def on_PING(self, writer, client, msg):
+        self.write(writer, [":%s PONG %s :%s" % (self.server_name, self.server_name, msg.params[-1])])
+
+    def on_JOIN(self, writer, client, msg):
+        """ Confirms each channel with a JOIN, and a NAMES reply of the synthetic users packed into 512 byte lines. """
+        nick, server = client['nick'], self.server_name
+        for channel in msg.params[0].split(','):
+            if channel not in client['channels']:
+                client['channels'].append(channel)
+            lines = [":%s!%s@fake JOIN %s" % (nick, client['user'], channel)]
+            prefix = ":%s 353 %s = %s :" % (server, nick, channel)
+            names, length = [nick], len(prefix) + len(nick)
+            for index in range(self.users):
+                name = ("@" if index % 50 == 0 else "+" if index % 10 == 0 else "") + "user%d" % index
+                if length + len(name) + 1 > 510:
+                    lines.append(prefix + " ".join(names))
+                    names, length = [], len(prefix) - 1
+                names.append(name)
+                length += len(name) + 1
+            lines.append(prefix + " ".join(names))
+            lines.append(":%s 366 %s %s :End of /NAMES list." % (server, nick, channel))
+            self.write(writer, lines)
+
+    def on_PART(self, writer, client, msg):
+        for channel in msg.params[0].split(','):
+            if channel in client['channels']:
+                client['channels'].remove(channel)
+            self.write(writer, [":%s!%s@fake PART %s" % (client['nick'], client['user'], channel)])
+
+    def on_QUIT(self, writer, client, msg):
+        self.write(writer, ["ERROR :Closing link (Quit: %s)" % (msg.params[0] if msg.params else '')])
+
+    async def ping_loop(self, writer):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            self.write(writer, ["PING :%s" % self.server_name])
+
+    async def message_loop(self, writer, client):
+        """ Sends PRIVMSGs from the synthetic users round-robin across the joined channels. """
+        start, sent = monotonic(), 0
+        users = max(self.users, 1)
+        while True:
+            if self.rate:
+                await asyncio.sleep(0.01)
+                due = int((monotonic() - start) * self.rate) - sent
+            else:
+                due = 100
+            if due > 0 and (channels := client['channels']):
+                self.write(writer, [":user%d!u@fake PRIVMSG %s :message %d from the load generator" % (
+                    (sent + index) % users, channels[(sent + index) % len(channels)], sent + index) for index in range(due)])
+                sent += due
+            await writer.drain()
+            if not self.rate:
+                await asyncio.sleep(0)  # drain() does not yield while the transport keeps up
+
+    async def replay_loop(self, writer, client):
+        """ Replays the replay file to a client, keeping the recorded pacing scaled by replay_speed. """
+        start = monotonic()
+        for timestamp, line in replay_lines(self.replay, client['nick']):
+            if timestamp is not None and self.replay_speed:
+                if (delay := timestamp / self.replay_speed - (monotonic() - start)) > 0:
+                    await writer.drain()
+                    await asyncio.sleep(delay)
+            self.write(writer, [line])
+        await writer.drain()
+
+
+def replay_lines(path, nick):
+    """
+    Yields (seconds since the first line, line) from a recorded session.
+    path is either a directory recorded by a Recorder, whose received lines are replayed,
+    or a text file where each line is a raw IRC line, optionally preceded by a unix timestamp and a tab.
+    In text files, {nick} is replaced with the nick of the client being replayed to.
+    """
+    if Path(path).is_dir():
+        reader = RecordingReader(path)
+        first = None
+        for timestamp, _, raw in reader.search(direction=INCOMING):
+            first = timestamp if first is None else first
+            yield timestamp - first, raw.decode('utf8', 'replace')
+        reader.close()
+        return
+
+    first = None
+    with open(path) as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            timestamp, tab, raw = line.partition('\t')
+            if tab and timestamp.replace('.', '', 1).isdigit():
+                first = float(timestamp) if first is None else first
+                yield float(timestamp) - first, raw.replace('{nick}', nick)
+            else:
+                yield None, line.replace('{nick}', nick)
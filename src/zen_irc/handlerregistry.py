@@ -0,0 +1,116 @@
+"""
+Dispatch table for IRC command handlers.
+"""
+
+from inspect import getattr_static, iscoroutinefunction
+
+
+HANDLER_MODES = ('inline', 'async', 'thread', 'process')
+
+
+def handler_mode(func, mode=None):
+    """ Returns the mode a handler runs in, coroutine functions default to async and others to inline. """
+    mode = mode or getattr(func, '_handler_mode', None) or ('async' if iscoroutinefunction(func) else 'inline')
+    if mode not in HANDLER_MODES:
+        raise ValueError("Unknown handler mode: %s" % mode)
+    return mode
+
+
+def handler(*commands, priority=0, mode=None):
+    """
+    Marks a method as a handler for the given commands.
+    Handlers run in priority order, lowest first; handle_<COMMAND> methods have a priority of 0.
+    mode is one of inline, async, thread or process, inline handlers run on the reader task,
+    others are started in order and run in order per channel without blocking it.
+    """
+    def decorator(func):
+        func._handles = getattr(func, '_handles', ()) + tuple((command.upper(), priority) for command in commands)
+        if mode:
+            func._handler_mode = handler_mode(func, mode)
+        return func
+    return decorator
+
+
+class HandlerRegistry:
+    """
+    Builds the handler table once when a subclass is created, from handle_<COMMAND> methods and @handler methods.
+    Instances bind the table in build_handlers, and can add extra subscribers with add_handler.
+    Handlers which don't run inline are passed to offload_handler(func, mode), which the client provides,
+    as ZenIRC does with its executor.
+    """
+    handler_table = {}
+    handler_modes = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        names = set()
+        for klass in cls.__mro__:
+            names.update(vars(klass))
+
+        table = {}
+        modes = {}
+        for name in sorted(names):
+            attr = getattr_static(cls, name)
+            if isinstance(attr, staticmethod):
+                attr = attr.__func__
+            if not callable(attr):
+                continue
+            entries = list(getattr(attr, '_handles', ()))
+            if name.startswith('handle_') and not any(command == name[7:] for command, _ in entries):
+                entries.append((name[7:], 0))
+            for command, priority in entries:
+                table.setdefault(command, []).append((priority, name))
+            if entries and (mode := handler_mode(attr)) != 'inline':
+                modes[name] = mode
+
+        cls.handler_table = {command: tuple(sorted(entries, key=lambda entry: entry[0]))
+                             for command, entries in table.items()}
+        cls.handler_modes = modes
+
+    def build_handlers(self):
+        """ Binds the class handler table to this instance. """
+        self._handler_entries = {}
+        for command, entries in self.handler_table.items():
+            self._handler_entries[command] = [(priority, self.bind_handler(name)) for priority, name in entries]
+        self.handlers = {}
+        for command in self._handler_entries:
+            self._rebuild_handlers(command)
+
+    def _rebuild_handlers(self, command):
+        """ Refreshes the dispatch tuple for a command. """
+        entries = self._handler_entries.get(command)
+        if not entries:
+            self.handlers.pop(command, None)
+            self._handler_entries.pop(command, None)
+            return
+        entries.sort(key=lambda entry: entry[0])
+        self.handlers[command] = tuple(self.wrap_handler(func) for _, func in entries)
+
+    def bind_handler(self, name):
+        """ Returns the function to dispatch for a handler method, offloading it unless it runs inline. """
+        func = getattr(self, name)
+        if (mode := self.handler_modes.get(name, 'inline')) == 'inline':
+            return func
+        return self.offload_handler(func, mode)
+
+    def wrap_handler(self, func):
+        """ Returns the function to dispatch for a handler, subclasses may wrap it, such as for timing. """
+        return func
+
+    def add_handler(self, command, func, priority=0, mode=None):
+        """
+        Subscribes func to a command, running it after existing handlers with the same priority.
+        mode is one of inline, async, thread or process, coroutine functions default to async.
+        """
+        command = command.upper()
+        if (mode := handler_mode(func, mode)) != 'inline':
+            func = self.offload_handler(func, mode)
+        self._handler_entries.setdefault(command, []).append((priority, func))
+        self._rebuild_handlers(command)
+
+    def remove_handler(self, command, func):
+        """ Unsubscribes func from a command. """
+        command = command.upper()
+        self._handler_entries[command] = [entry for entry in self._handler_entries.get(command, [])
+                                          if entry[1] != func and getattr(entry[1], '__wrapped__', None) != func]
+        self._rebuild_handlers(command)
@@ -0,0 +1,101 @@
+"""
+Scheduling of received lines, so bursts don't delay PING replies or registration.
+"""
+
+from collections import deque
+from time import monotonic
+import asyncio
+
+
+FAST_COMMANDS = frozenset([b'PING', b'PONG', b'CAP', b'AUTHENTICATE', b'ERROR',
+                           b'001', b'002', b'003', b'004', b'005', b'432', b'433',
+                           b'900', b'903', b'904', b'905', b'906', b'907', b'908'])
+CHURN_COMMANDS = frozenset(['JOIN', 'PART', 'QUIT'])
+
+
+def raw_command(raw_line):
+    """ Returns the command of a raw line, skipping its tags and source, without tokenising it. """
+    start = 0
+    if raw_line[:1] == b'@':
+        start = raw_line.find(b' ') + 1
+    if raw_line[start:start + 1] == b':':
+        start = raw_line.find(b' ', start) + 1
+    end = raw_line.find(b' ', start)
+    return raw_line[start:end] if end != -1 else raw_line[start:]
+
+
+class InboundScheduler:
+    """
+    Queues received lines for the inbound loop, so the reader keeps reading while a burst is processed.
+    Lines with FAST_COMMANDS, such as PING and registration numerics, are processed by the reader at once instead.
+    The queue is in a burst once it holds more than burst_threshold lines, until it is drained.
+    During a burst, membership churn is applied in runs and logged as one summary when the burst ends.
+    The reader waits while queue_limit lines are queued, leaving the rest in the socket buffer.
+    """
+    def __init__(self, burst_threshold=200, queue_limit=20000, time_slice=0.01):
+        self.burst_threshold = burst_threshold
+        self.queue_limit = queue_limit
+        self.time_slice = time_slice  # Seconds of processing before yielding to other tasks
+        self.queue = deque()  # (time received, raw line)
+        self.ready = asyncio.Event()
+        self.space = asyncio.Event()
+        self.space.set()
+        self.lag = 0.0  # Seconds the last processed line waited in the queue
+        self.bursting = False
+        self.burst_start = None
+        self.burst_lines = 0
+        self.burst_peak_lag = 0.0
+        self.burst_churn = {}  # command: lines applied as churn in the current burst
+
+    def __len__(self):
+        return len(self.queue)
+
+    @property
+    def current_lag(self):
+        """ Seconds the oldest queued line has waited, or 0 if the queue is empty. """
+        return monotonic() - self.queue[0][0] if self.queue else 0.0
+
+    def push(self, raw_line, received):
+        """ Queues a raw line, starting a burst if the queue passes burst_threshold. """
+        self.queue.append((received, raw_line))
+        if not self.bursting and len(self.queue) > self.burst_threshold:
+            self.bursting = True
+            self.burst_start = received
+        if len(self.queue) >= self.queue_limit:
+            self.space.clear()
+        self.ready.set()
+
+    def pop(self):
+        """ Returns the next raw line, updating the lag. """
+        received, raw_line = self.queue.popleft()
+        self.lag = monotonic() - received
+        if self.bursting:
+            self.burst_lines += 1
+            if self.lag > self.burst_peak_lag:
+                self.burst_peak_lag = self.lag
+        if len(self.queue) < self.queue_limit:
+            self.space.set()
+        return raw_line
+
+    def count_churn(self, command, count):
+        self.burst_churn[command] = self.burst_churn.get(command, 0) + count
+
+    def end_burst(self):
+        """ Ends a burst once the queue is drained, returning a summary of it, or None if there was no burst. """
+        if not self.bursting or self.queue:
+            return None
+        summary = {'lines': self.burst_lines, 'seconds': monotonic() - self.burst_start,
+                   'peak_lag': self.burst_peak_lag, 'churn': self.burst_churn}
+        self.bursting = False
+        self.burst_start = None
+        self.burst_lines = 0
+        self.burst_peak_lag = 0.0
+        self.burst_churn = {}
+        return summary
+
+    def clear(self):
+        self.queue.clear()
+        self.ready.clear()
+        self.space.set()
+        self.lag = 0.0
+        self.end_burst()
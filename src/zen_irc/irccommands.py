@@ -2,9 +2,15 @@
 IRC protocol commands.
 """
 
-from threading import Event
+from asyncio import Event, wait_for
 from irctokens import build as _build
 
+from .targets import pack_targets, pack_joins, split_text, merge_commands
+
+
+DEFAULT_MAX_TARGETS = {'JOIN': None, 'PART': None, 'PRIVMSG': 1, 'NOTICE': 1}
+DEFAULT_SOURCE_LENGTHS = {'NICKLEN': 30, 'USERLEN': 10, 'HOSTLEN': 63}  # Used if the server doesn't send them
+
 
 class IRCCommands:
     def user(self, username, mode=0, unused='*', realname=None):
@@ -18,35 +24,129 @@ class IRCCommands:
         self.send(_build("NICK", [nickname]))
         self.nickname = nickname
 
+    def _track_channel(self, channel, key=None):
+        """Sets up the state for a channel being joined, restoring it if it was parted."""
+        if channel in self._channels:
+            self.channels[channel] = self._channels.pop(channel)
+        elif channel not in self.channels:
+            self.channels[channel] = {'messages': self.new_scrollback(channel)}
+        if 'joined' not in self.channels[channel]:
+            self.channels[channel]['joined'] = Event()
+        if key:
+            self.channels[channel]['key'] = key
+
+    def queue_command(self, command, target, arg=None):
+        """
+        Queue a JOIN, PART, PRIVMSG or NOTICE to be merged with others queued in the same loop tick.
+        Any other send flushes the queue first, so commands keep their order.
+        """
+        self.pending_commands.append((command, target, arg))
+        if len(self.pending_commands) == 1:
+            if self.in_loop():
+                self.loop.call_soon(self.flush_commands)
+            else:
+                self.flush_commands()
+
+    def flush_commands(self):
+        """
+        Send queued commands, merging their targets into comma separated lists within the server's limits.
+        If a merged group can't be packed, its entries are sent one by one, so only the entry which doesn't fit is dropped.
+        """
+        pending, self.pending_commands = self.pending_commands, []
+        for command, entries in merge_commands(pending):
+            try:
+                lines = self.pack_command(command, entries)
+            except ValueError as e:
+                if len(entries) == 1:
+                    self.logger.error("Unable to send %s to %s: %s", command, entries[0][0], e)
+                    continue
+                lines = []
+                for entry in entries:
+                    try:
+                        lines += self.pack_command(command, [entry])
+                    except ValueError as e:
+                        self.logger.error("Unable to send %s to %s: %s", command, entry[0], e)
+            for line in lines:
+                self.send(line)
+
+    def pack_command(self, command, entries):
+        """
+        Returns the lines for a merged group of (target, arg) entries.
+        Message text too long for one line is split into several, a PART reason is cut to fit.
+        Raises ValueError if a target can't fit in a line.
+        """
+        max_targets = self.isupport.max_targets(command, DEFAULT_MAX_TARGETS[command])
+        if command == 'JOIN':
+            return [_build("JOIN", params) for params in pack_joins(entries, max_targets)]
+        targets = [target for target, _ in entries]
+        reserved = self.source_length()
+        if not (text := entries[0][1]):
+            return [_build(command, [",".join(line_targets)])
+                    for line_targets in pack_targets(command, targets, (), max_targets, reserved=reserved)]
+        chunks = split_text(command, max(targets, key=lambda target: len(target.encode())), text, reserved=reserved)
+        if command == 'PART':
+            chunks = chunks[:1]
+        return [_build(command, [",".join(line_targets), chunk])
+                for chunk in chunks for line_targets in pack_targets(command, targets, [chunk], max_targets, reserved=reserved)]
+
+    def source_length(self):
+        """
+        Returns the length of the :nick!user@host prefix the server adds when relaying our lines.
+        Uses our user@host once a JOIN has shown it, otherwise the longest the server's NICKLEN, USERLEN and HOSTLEN allow.
+        """
+        if self.userhost:
+            return len((':%s!%s ' % (self.nickname, self.userhost)).encode())
+        return 4 + sum(self.isupport.get_int(key, default) for key, default in DEFAULT_SOURCE_LENGTHS.items())
+
     def join(self, channel, key=None):
         """Join a channel. The JOIN handler sets the channel's joined event."""
         if channel in self.channels and self.channels[channel]['joined'].is_set():
             self.logger.warning("Channel already joined: %s", channel)
             return
-        args = [channel, key] if key else [channel]
-        self.send(_build("JOIN", args))
-        if channel in self._channels:
-            self.channels[channel] = self._channels.pop(channel)
-        else:
-            self.channels[channel] = {'messages': [], 'users': []}
-        self.channels[channel]['joined'] = Event()
+        self._track_channel(channel, key)
+        self.queue_command("JOIN", channel, key or self.channels[channel].get('key'))
+
+    def join_channels(self, channels):
+        """Join several channels, which are merged into as few JOIN lines as possible."""
+        for channel in channels:
+            if channel not in self.channels or not self.channels[channel]['joined'].is_set():
+                self.join(channel)
+
+    async def wait_joined(self, channel, timeout=None):
+        """Wait until a channel has been joined."""
+        await wait_for(self.channels[channel]['joined'].wait(), timeout)
 
     def msg(self, target, message):
-        """Send a message to a target."""
-        data = _build("PRIVMSG", [target, message])
-        if target not in self.channels:
-            self.join(target)
-            self.channels[target]['joined'].wait()
-        self.channels[target]['messages'].append(message)
-        self.send(data)
+        """
+        Send a message to a target, or a list of targets.
+        Channels which are not joined yet are joined, and the message is sent when the JOIN handler confirms it.
+        Messages with the same text queued together are sent to multiple targets at once where the server allows it.
+        """
+        if isinstance(target, (list, tuple, set)):
+            for single_target in target:
+                self.msg(single_target, message)
+            return
+        if target[0] in self.isupport.chantypes:
+            if target not in self.channels:
+                self.join(target)
+            channel = self.channels[target]
+            if not channel['joined'].is_set():
+                channel.setdefault('pending', []).append(message)
+                return
+            if 'echo-message' not in self.capabilities:  # Otherwise the echo is recorded when it is received
+                channel['messages'].append(self.nickname, message)
+        self.queue_command("PRIVMSG", target, message)
 
     def part(self, channel, message=None):
         """Part a channel."""
-        args = [channel, message] if message else [channel]
-        self.send(_build("PART", args))
+        self.queue_command("PART", channel, message)
         self.channels[channel]['joined'].clear()
         self._channels[channel] = self.channels.pop(channel)
 
+    def ping(self, token):
+        """Ping the server, it replies with a PONG."""
+        self.send(_build("PING", [token]), quiet=True)
+
     def pong(self, server):
         """Respond to a ping."""
         self.send(_build("PONG", [server]), quiet=True)
@@ -55,5 +155,5 @@ class IRCCommands:
         """Quit the server."""
         data = _build("QUIT", [message]) if message else _build("QUIT")
         self.send(data)
-        self.running.clear()
+        self.stopped.set()  # Don't reconnect when the server closes the connection
 
@@ -0,0 +1,119 @@
+"""
+Handlers for IRCv3 capability negotiation and batches.
+"""
+
+from irctokens import build as _build
+
+
+class Batch:
+    """ Lines collected for a BATCH, processed together when it ends. """
+    __slots__ = ('ref', 'type', 'params', 'lines')
+
+    def __init__(self, ref, batch_type, params):
+        self.ref = ref
+        self.type = batch_type
+        self.params = params
+        self.lines = []
+
+
+class IRCv3Handlers:
+    def cap_start(self):
+        """ Starts capability negotiation, registration waits for CAP END. """
+        self.capabilities_available = {}
+        self.capabilities.clear()
+        self.cap_requested = set()
+        self.send(_build("CAP", ["LS", "302"]))
+
+    def cap_request(self, available):
+        """ Requests the wanted capabilities from those available, ending negotiation if there are none. """
+        wanted = [cap for cap in self.capabilities_wanted if cap in available and cap not in self.capabilities]
+        if not wanted:
+            return self.cap_end()
+        self.cap_requested.update(wanted)
+        self.send(_build("CAP", ["REQ", " ".join(wanted)]))
+
+    def cap_end(self):
+        if not self.registered.is_set():
+            self.send(_build("CAP", ["END"]))
+
+    def handle_CAP(self, msg):
+        """ Handle CAP messages. """
+        subcommand = msg.params[1]
+        more = len(msg.params) > 3 and msg.params[2] == '*'
+        caps = msg.params[-1].split()
+        if subcommand in ('LS', 'NEW'):
+            for cap in caps:
+                name, _, value = cap.partition('=')
+                self.capabilities_available[name] = value
+            if not more:
+                self.cap_request(self.capabilities_available if subcommand == 'LS' else
+                                 [cap.partition('=')[0] for cap in caps])
+        elif subcommand == 'ACK':
+            for cap in caps:
+                if cap.startswith('-'):
+                    self.capabilities.discard(cap[1:])
+                else:
+                    self.capabilities.add(cap)
+                self.cap_requested.discard(cap.lstrip('-'))
+            self.logger.info("[%s] Enabled capabilities: %s" % (msg.source, " ".join(sorted(self.capabilities))))
+            if not self.cap_requested:
+                self.cap_end()
+        elif subcommand == 'NAK':
+            self.logger.warning("[%s] Capabilities rejected: %s" % (msg.source, msg.params[-1]))
+            self.cap_requested.difference_update(caps)
+            if not self.cap_requested:
+                self.cap_end()
+        elif subcommand == 'DEL':
+            for cap in caps:
+                self.capabilities.discard(cap)
+                self.capabilities_available.pop(cap, None)
+
+    def handle_BATCH(self, msg):
+        """ Handle BATCH messages, collecting tagged lines until the batch ends. """
+        ref = msg.params[0]
+        if ref.startswith('+'):
+            self.batches[ref[1:]] = Batch(ref[1:], msg.params[1], msg.params[2:])
+        elif batch := self.batches.pop(ref[1:], None):
+            self.process_batch(batch)
+
+    def process_batch(self, batch):
+        """ Processes a finished batch with its batch_<type> method, or by dispatching each line. """
+        if handler := getattr(self, 'batch_' + batch.type.replace('-', '_').replace('/', '_'), None):
+            return handler(batch)
+        for line in batch.lines:
+            self.dispatch_line(line)
+
+    def process_batch_churn(self, batch):
+        """ Applies the JOIN, PART and QUIT lines of a batch with apply_churn, in runs, and dispatches the other lines. """
+        run = []
+        for line in batch.lines:
+            if self.is_churn(line):
+                if run and run[0].command != line.command:
+                    self.apply_churn(run)
+                    run = []
+                run.append(line)
+                continue
+            if run:
+                self.apply_churn(run)
+                run = []
+            self.dispatch_line(line)
+        if run:
+            self.apply_churn(run)
+
+    def batch_netsplit(self, batch):
+        """ Removes the users of a netsplit from the membership index at once, other QUIT handlers still see each line. """
+        self.process_batch_churn(batch)
+        self.logger.info("Netsplit %s: %d users quit." % (" ".join(batch.params), len(batch.lines)))
+
+    def batch_netjoin(self, batch):
+        """ Adds the users of a netjoin to the membership index at once, other JOIN handlers still see each line. """
+        self.process_batch_churn(batch)
+        self.logger.info("Netjoin %s: %d users joined." % (" ".join(batch.params), len(batch.lines)))
+
+    def handle_AWAY(self, msg):
+        """ Handle AWAY messages, sent with away-notify. """
+        nick = self.members.fold(msg.hostmask.nickname)
+        if msg.params:
+            self.away_nicks.add(nick)
+        else:
+            self.away_nicks.discard(nick)
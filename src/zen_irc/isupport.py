@@ -0,0 +1,145 @@
+"""
+Parsed ISUPPORT (005) server features.
+"""
+
+from string import ascii_uppercase, ascii_lowercase
+from re import compile
+
+
+CASEMAPPINGS = {
+    'ascii': str.maketrans(ascii_uppercase, ascii_lowercase),
+    'rfc1459': str.maketrans(ascii_uppercase + '[]\\~', ascii_lowercase + '{}|^'),
+    'strict-rfc1459': str.maketrans(ascii_uppercase + '[]\\', ascii_lowercase + '{}|'),
+}
+
+_HEX_ESCAPE = compile(r'\\x([0-9A-Fa-f]{2})')
+
+
+def parse_prefix(token):
+    """ Parses an ISUPPORT PREFIX value such as (ov)@+ into a dict of prefix characters to modes. """
+    if not token:
+        return {}
+    modes, _, prefixes = token[1:].partition(')')
+    return dict(zip(prefixes, modes))
+
+
+class ISupport:
+    """
+    Server features from 005 lines, updated incrementally as they arrive.
+    Raw values are kept in a dict, typed values are parsed on first use and cached until the token changes.
+    """
+    def __init__(self):
+        self.tokens = {}
+        self._cache = {}
+
+    def __contains__(self, key):
+        return key in self.tokens
+
+    def __getitem__(self, key):
+        return self.tokens[key]
+
+    def get(self, key, default=None):
+        return self.tokens.get(key, default)
+
+    def update(self, tokens):
+        """ Adds the tokens from a 005 line, a token starting with - removes that feature. """
+        for token in tokens:
+            if token.startswith('-'):
+                self.tokens.pop(token[1:], None)
+                self._cache.pop(token[1:], None)
+                continue
+            key, _, value = token.partition('=')
+            self.tokens[key] = _HEX_ESCAPE.sub(lambda match: chr(int(match.group(1), 16)), value)
+            self._cache.pop(key, None)
+
+    def restore(self, tokens):
+        """ Replaces the features with a dict of parsed tokens, such as a saved copy of self.tokens. """
+        self.tokens = dict(tokens)
+        self._cache.clear()
+
+    def _cached(self, key, parse):
+        if key not in self._cache:
+            self._cache[key] = parse(self.tokens.get(key))
+        return self._cache[key]
+
+    def get_int(self, key, default=None):
+        """ Returns a numeric feature, or default if it is missing or has no value. """
+        value = self.tokens.get(key)
+        return int(value) if value and value.isdigit() else default
+
+    @property
+    def chantypes(self):
+        return self._cached('CHANTYPES', lambda value: '#&' if value is None else value)
+
+    @property
+    def prefix(self):
+        """ Dict of membership prefix characters to channel modes. """
+        return self._cached('PREFIX', lambda value: parse_prefix('(ov)@+' if value is None else value))
+
+    @property
+    def chanmodes(self):
+        """ The four CHANMODES groups: list modes, modes with a parameter, modes with a parameter when set, and flags. """
+        def parse(value):
+            groups = ('beI,k,l,imnpst' if value is None else value).split(',')[:4]
+            return tuple(groups + [''] * (4 - len(groups)))
+        return self._cached('CHANMODES', parse)
+
+    def parse_modes(self, modes, params):
+        """
+        Splits channel mode changes such as +ov-k nick nick key into (adding, mode, param) tuples.
+        param is None for modes without one, or if the line is missing it.
+        """
+        lists, always, when_set, _ = self.chanmodes
+        prefix_modes = self.prefix.values()
+        params = iter(params)
+        changes, adding = [], True
+        for mode in modes:
+            if mode in '+-':
+                adding = mode == '+'
+            elif mode in prefix_modes or mode in lists or mode in always or (adding and mode in when_set):
+                changes.append((adding, mode, next(params, None)))
+            else:
+                changes.append((adding, mode, None))
+        return changes
+
+    @property
+    def casemapping(self):
+        return self._cached('CASEMAPPING', lambda value: (value or 'rfc1459').lower())
+
+    @property
+    def casemap(self):
+        """ Translation table for the server's CASEMAPPING. """
+        return CASEMAPPINGS.get(self.casemapping, CASEMAPPINGS['rfc1459'])
+
+    def casefold(self, name):
+        """ Casefolds a nick or channel name using the server's CASEMAPPING. """
+        return name.translate(self.casemap)
+
+    @property
+    def targmax(self):
+        """ Dict of commands to their maximum targets, None meaning no limit. Malformed entries are skipped, so the default applies. """
+        def parse(value):
+            limits = {}
+            for limit in (value or '').split(','):
+                command, _, count = limit.partition(':')
+                if not command or (count and not (count.isdigit() and int(count))):
+                    continue
+                limits[command.upper()] = int(count) if count else None
+            return limits
+        return self._cached('TARGMAX', parse)
+
+    @property
+    def maxtargets(self):
+        return self._cached('MAXTARGETS', lambda value: int(value) if value and value.isdigit() else None)
+
+    def max_targets(self, command, default=1):
+        """
+        Returns the maximum number of targets for a command, from TARGMAX then MAXTARGETS.
+        Returns None if the server sets no limit, and default if it doesn't say.
+        """
+        command = command.upper()
+        if command in self.targmax:
+            return self.targmax[command]
+        if self.maxtargets is not None and command in ('PRIVMSG', 'NOTICE'):
+            return self.maxtargets
+        return default
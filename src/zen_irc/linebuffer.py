@@ -0,0 +1,52 @@
+"""
+Splits raw IRC lines out of received data.
+"""
+
+
+class LineBuffer:
+    """
+    Splits complete lines out of received data, keeping the partial line for the next push.
+    Also adapts the size of reads to the incoming data, growing while reads fill it,
+    and shrinking after a run of small reads.
+    Larger reads mean fewer, larger splits, but every line of a read is held at once,
+    so max_read_size also bounds the memory used by a burst.
+    """
+    def __init__(self, read_size=4096, min_read_size=1024, max_read_size=8192, shrink_after=8):
+        self.partial = b''
+        self.read_size = read_size
+        self.min_read_size = min_read_size
+        self.max_read_size = max_read_size
+        self.shrink_after = shrink_after
+        self.small_reads = 0
+
+    def clear(self):
+        self.partial = b''
+        self.small_reads = 0
+
+    def adapt(self, nread):
+        """ Adjusts read_size based on the size of the last read. """
+        if nread >= self.read_size:
+            self.read_size = min(self.read_size * 2, self.max_read_size)
+            self.small_reads = 0
+        elif nread < self.read_size // 4:
+            self.small_reads += 1
+            if self.small_reads >= self.shrink_after:
+                self.read_size = max(self.read_size // 2, self.min_read_size)
+                self.small_reads = 0
+        else:
+            self.small_reads = 0
+
+    def push(self, data):
+        """
+        Returns the complete lines in data as bytes, without line endings, skipping blank lines.
+        Data is split on newlines in one call, which is faster than splitting on CRLF, then carriage returns are stripped.
+        """
+        if self.partial:
+            data = self.partial + data
+        lines = data.split(b'\n')
+        self.partial = lines.pop()
+        lines = [line.rstrip(b'\r') for line in lines]
+
+        if not all(lines):
+            return [line for line in lines if line]
+        return lines
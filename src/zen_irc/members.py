@@ -0,0 +1,188 @@
+"""
+Channel membership tracking.
+"""
+
+from .isupport import CASEMAPPINGS, parse_prefix
+
+
+class MembershipIndex:
+    """
+    Tracks channel members with a dict of nicks to modes per channel, and a reverse map of nicks to channels.
+    Channels and nicks are keyed by their casefolded names, display names are kept once per nick.
+    """
+    def __init__(self, casemapping='rfc1459', prefix='(ov)@+'):
+        self.casemap = CASEMAPPINGS['rfc1459']
+        self.prefixes = parse_prefix(prefix)
+        self.channels = {}  # folded channel: {folded nick: modes}
+        self.nicks = {}  # folded nick: {folded channel, ...}
+        self.names = {}  # folded nick or channel: display name
+        self.set_casemapping(casemapping)
+
+    def __len__(self):
+        """ Returns the total number of memberships. """
+        return sum(len(members) for members in self.channels.values())
+
+    def clear(self):
+        self.channels.clear()
+        self.nicks.clear()
+        self.names.clear()
+
+    def fold(self, name):
+        """ Casefolds a nick or channel name using the server's CASEMAPPING. """
+        return name.translate(self.casemap)
+
+    def set_casemapping(self, casemapping):
+        """ Sets the casemapping, refolding existing entries if it changed. """
+        casemap = CASEMAPPINGS.get(casemapping.lower(), CASEMAPPINGS['rfc1459'])
+        if casemap is self.casemap:
+            return
+        self.casemap = casemap
+        if self.channels:
+            channels = {self.names[channel]: {self.names[nick]: modes for nick, modes in members.items()}
+                        for channel, members in self.channels.items()}
+            self.clear()
+            for channel, members in channels.items():
+                for nick, modes in members.items():
+                    self.add(channel, nick, modes)
+
+    def set_prefix(self, prefixes):
+        """ Sets the channel membership prefixes, from a dict of prefix characters to modes or a PREFIX value. """
+        self.prefixes = parse_prefix(prefixes) if isinstance(prefixes, str) else prefixes
+
+    def split_name(self, name):
+        """ Splits a NAMES entry such as @+nick!user@host into its modes and nick. """
+        modes = ''
+        index = 0
+        while index < len(name) and name[index] in self.prefixes:
+            modes += self.prefixes[name[index]]
+            index += 1
+        nick = name[index:]
+        if '!' in nick:
+            nick = nick.split('!', 1)[0]
+        return modes, nick
+
+    def add(self, channel, nick, modes=''):
+        """ Adds a nick to a channel, replacing its modes if it is already a member. """
+        folded_channel = self.fold(channel)
+        folded_nick = self.fold(nick)
+        if folded_channel not in self.channels:
+            self.channels[folded_channel] = {}
+            self.names[folded_channel] = channel
+        self.channels[folded_channel][folded_nick] = modes
+        if folded_nick not in self.nicks:
+            self.nicks[folded_nick] = set()
+            self.names[folded_nick] = nick
+        self.nicks[folded_nick].add(folded_channel)
+
+    def set_mode(self, channel, nick, mode, adding=True):
+        """ Adds or removes a member's channel mode, such as o from MODE +o, keeping modes in PREFIX order. """
+        members = self.channels.get(self.fold(channel))
+        folded_nick = self.fold(nick)
+        if members is None or folded_nick not in members:
+            return
+        modes = members[folded_nick].replace(mode, '')
+        if adding:
+            order = list(self.prefixes.values())
+            modes = ''.join(sorted(modes + mode, key=lambda char: order.index(char) if char in order else len(order)))
+        members[folded_nick] = modes
+
+    def add_names(self, channel, names):
+        """ Adds the entries of a NAMES reply to a channel. """
+        for name in names:
+            if name:
+                modes, nick = self.split_name(name)
+                self.add(channel, nick, modes)
+
+    def add_many(self, memberships):
+        """ Adds (channel, nick) pairs without modes, such as a run of JOINs. """
+        fold, channels, nicks, names = self.fold, self.channels, self.nicks, self.names
+        for channel, nick in memberships:
+            folded_channel, folded_nick = fold(channel), fold(nick)
+            if (members := channels.get(folded_channel)) is None:
+                members = channels[folded_channel] = {}
+                names[folded_channel] = channel
+            members[folded_nick] = ''
+            if (nick_channels := nicks.get(folded_nick)) is None:
+                nick_channels = nicks[folded_nick] = set()
+                names[folded_nick] = nick
+            nick_channels.add(folded_channel)
+
+    def _forget(self, folded_nick, folded_channel):
+        """ Removes a channel from a nick's channels, dropping the nick when it has none left. """
+        if channels := self.nicks.get(folded_nick):
+            channels.discard(folded_channel)
+            if not channels:
+                del self.nicks[folded_nick]
+                self.names.pop(folded_nick, None)
+
+    def remove(self, channel, nick):
+        """ Removes a nick from a channel. """
+        folded_channel = self.fold(channel)
+        folded_nick = self.fold(nick)
+        if members := self.channels.get(folded_channel):
+            members.pop(folded_nick, None)
+        self._forget(folded_nick, folded_channel)
+
+    def remove_many(self, memberships):
+        """ Removes (channel, nick) pairs, such as a run of PARTs. """
+        fold, channels = self.fold, self.channels
+        for channel, nick in memberships:
+            folded_channel, folded_nick = fold(channel), fold(nick)
+            if members := channels.get(folded_channel):
+                members.pop(folded_nick, None)
+            self._forget(folded_nick, folded_channel)
+
+    def remove_channel(self, channel):
+        """ Removes a channel and all of its memberships, used when we leave it. """
+        folded_channel = self.fold(channel)
+        for folded_nick in self.channels.pop(folded_channel, {}):
+            self._forget(folded_nick, folded_channel)
+        self.names.pop(folded_channel, None)
+
+    def quit(self, nick):
+        """ Removes a nick from every channel, returning the display names of those channels. """
+        folded_nick = self.fold(nick)
+        channels = self.nicks.pop(folded_nick, ())
+        for folded_channel in channels:
+            self.channels[folded_channel].pop(folded_nick, None)
+        self.names.pop(folded_nick, None)
+        return [self.names[channel] for channel in channels]
+
+    def quit_many(self, nicks):
+        """ Removes nicks from every channel, such as a run of QUITs during a netsplit. """
+        fold, channels, names = self.fold, self.channels, self.names
+        for nick in nicks:
+            folded_nick = fold(nick)
+            for folded_channel in self.nicks.pop(folded_nick, ()):
+                channels[folded_channel].pop(folded_nick, None)
+            names.pop(folded_nick, None)
+
+    def rename(self, old_nick, new_nick):
+        """ Moves an old nick's memberships to a new nick. """
+        folded_old = self.fold(old_nick)
+        folded_new = self.fold(new_nick)
+        channels = self.nicks.pop(folded_old, None)
+        self.names.pop(folded_old, None)
+        if channels is None:
+            return
+        for folded_channel in channels:
+            members = self.channels[folded_channel]
+            members[folded_new] = members.pop(folded_old)
+        self.nicks[folded_new] = channels
+        self.names[folded_new] = new_nick
+
+    def members(self, channel):
+        """ Returns the display names of a channel's members. """
+        names = self.names
+        return [names[nick] for nick in self.channels.get(self.fold(channel), ())]
+
+    def modes(self, channel, nick):
+        """ Returns a member's channel modes, or None if the nick is not in the channel. """
+        return self.channels.get(self.fold(channel), {}).get(self.fold(nick))
+
+    def is_member(self, channel, nick):
+        return self.fold(nick) in self.channels.get(self.fold(channel), ())
+
+    def channels_of(self, nick):
+        """ Returns the display names of the channels a nick is in. """
+        return [self.names[channel] for channel in self.nicks.get(self.fold(nick), ())]
@@ -0,0 +1,195 @@
+"""
+Counters, gauges and latency histograms, with an optional Prometheus text endpoint.
+"""
+
+from bisect import bisect_left
+from time import perf_counter
+import asyncio
+
+
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+
+class Histogram:
+    """ Counts observations into cumulative buckets, keeping their sum and count. """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """ Yields (upper bound, cumulative count) pairs, ending with +Inf. """
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+    def merge(self, other):
+        """ Adds the observations of another histogram with the same buckets. """
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def percentile(self, fraction):
+        """ Returns the upper bound of the bucket holding the given fraction of observations, such as 0.99. """
+        if not self.count:
+            return 0.0
+        for bound, count in self.cumulative():
+            if count >= self.count * fraction:
+                return bound
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.sum,
+                'buckets': {str(bound): count for bound, count in self.cumulative()}}
+
+
+class Metrics:
+    """
+    Named counters, gauges and histograms, each keyed by an optional label value.
+    Gauges are functions which are called when metrics are read, so they cost nothing until then.
+    """
+    enabled = True
+
+    def __init__(self, prefix='zenirc'):
+        self.prefix = prefix
+        self.counters = {}  # name: {key: value}
+        self.gauges = {}  # name: {key: func}
+        self.histograms = {}  # name: {key: Histogram}
+        self.help = {}
+        self.labels = {}  # name: label name for its keys
+
+    def describe(self, name, text, label=None):
+        """ Sets the help text of a metric, and the label name its keys are rendered with. """
+        self.help[name] = text
+        if label:
+            self.labels[name] = label
+
+    def inc(self, name, key=None, amount=1):
+        counter = self.counters.setdefault(name, {})
+        counter[key] = counter.get(key, 0) + amount
+
+    def observe(self, name, value, key=None):
+        histograms = self.histograms.setdefault(name, {})
+        if (histogram := histograms.get(key)) is None:
+            histogram = histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name, func, key=None):
+        """ Registers a function returning the current value of a gauge. """
+        self.gauges.setdefault(name, {})[key] = func
+
+    def timed(self, name, func, key=None):
+        """ Wraps func so its run time is observed in a histogram. """
+        histograms = self.histograms.setdefault(name, {})
+        if (histogram := histograms.get(key)) is None:
+            histogram = histograms[key] = Histogram()
+
+        def timed_func(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - start)
+        timed_func.__wrapped__ = func
+        return timed_func
+
+    def snapshot(self):
+        """ Returns the current values of all metrics as a dict. """
+        return {'counters': {name: dict(values) for name, values in self.counters.items()},
+                'gauges': {name: {key: func() for key, func in values.items()} for name, values in self.gauges.items()},
+                'histograms': {name: {key: histogram.snapshot() for key, histogram in values.items()}
+                               for name, values in self.histograms.items()}}
+
+    def _labels(self, name, key, extra=''):
+        labels = []
+        if key is not None:
+            value = str(key).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            labels.append('%s="%s"' % (self.labels.get(name, 'key'), value))
+        if extra:
+            labels.append(extra)
+        return '{%s}' % ','.join(labels) if labels else ''
+
+    def render(self):
+        """ Renders all metrics in the Prometheus text exposition format. """
+        lines = []
+        for kind, metrics in (('counter', self.counters), ('gauge', self.gauges), ('histogram', self.histograms)):
+            for name, values in sorted(metrics.items()):
+                full_name = '%s_%s' % (self.prefix, name)
+                if name in self.help:
+                    lines.append('# HELP %s %s' % (full_name, self.help[name]))
+                lines.append('# TYPE %s %s' % (full_name, kind))
+                for key, value in values.items():
+                    if kind == 'counter':
+                        lines.append('%s%s %s' % (full_name, self._labels(name, key), value))
+                    elif kind == 'gauge':
+                        lines.append('%s%s %s' % (full_name, self._labels(name, key), value()))
+                    else:
+                        for bound, count in value.cumulative():
+                            le = 'le="%s"' % ('+Inf' if bound == float('inf') else bound)
+                            lines.append('%s_bucket%s %d' % (full_name, self._labels(name, key, le), count))
+                        lines.append('%s_sum%s %s' % (full_name, self._labels(name, key), value.sum))
+                        lines.append('%s_count%s %d' % (full_name, self._labels(name, key), value.count))
+        return '\n'.join(lines) + '\n'
+
+
+class NullMetrics:
+    """ Metrics which record nothing, used when metrics are disabled. """
+    enabled = False
+
+    def describe(self, name, text, label=None):
+        pass
+
+    def inc(self, name, key=None, amount=1):
+        pass
+
+    def observe(self, name, value, key=None):
+        pass
+
+    def gauge(self, name, func, key=None):
+        pass
+
+    def timed(self, name, func, key=None):
+        return func
+
+    def snapshot(self):
+        return {}
+
+    def render(self):
+        return ''
+
+
+async def serve_metrics(metrics, host='127.0.0.1', port=9105):
+    """
+    Serves metrics.render() over HTTP, for Prometheus to scrape.
+    metrics may be a Metrics object or a function returning the text to serve.
+    Returns the asyncio server.
+    """
+    render = metrics if callable(metrics) else metrics.render
+
+    async def handle(reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            method, _, rest = request.decode('latin-1').partition(' ')
+            if method != 'GET' or not rest.startswith(('/metrics ', '/ ')):
+                writer.write(b'HTTP/1.0 404 Not Found\r\nContent-Length: 0\r\n\r\n')
+            else:
+                body = render().encode()
+                writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                             b'Content-Length: %d\r\n\r\n' % len(body) + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,144 @@
+"""
+Outbound flood control.
+"""
+
+from collections import deque
+from time import monotonic
+
+
+PROTOCOL_COMMANDS = frozenset(['PONG', 'PING', 'CAP', 'AUTHENTICATE'])
+MESSAGE_COMMANDS = frozenset(['PRIVMSG', 'NOTICE', 'TAGMSG'])
+
+
+class TokenBucket:
+    """ Allows burst lines at once, refilling at rate lines per second. A rate of 0 disables limiting. """
+    def __init__(self, burst=5, rate=1.0):
+        self.burst = burst
+        self.rate = rate
+        self.tokens = float(burst)
+        self.updated = monotonic()
+
+    def refill(self, now=None):
+        now = now or monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self):
+        """ Returns the number of whole tokens available. """
+        if not self.rate:
+            return float('inf')
+        self.refill()
+        return int(self.tokens)
+
+    def reset(self):
+        """ Refills the bucket, such as for a new connection. """
+        self.tokens = float(self.burst)
+        self.updated = monotonic()
+
+    def take(self, count=1):
+        if self.rate:
+            self.tokens -= count
+
+    def delay(self):
+        """ Returns the seconds until the next token is available. """
+        if not self.rate:
+            return 0
+        self.refill()
+        return max(0, (1 - self.tokens) / self.rate)
+
+
+class OutboundScheduler:
+    """
+    Queues outbound lines into priority lanes, releasing them as the token bucket allows.
+    Protocol replies such as PONG go first. Other commands and messages keep their order,
+    a command is only sent once the messages queued before it have been, and before those queued after it.
+    Messages are taken round-robin across targets.
+    """
+    def __init__(self, burst=5, rate=1.0):
+        self.bucket = TokenBucket(burst, rate)
+        self.protocol = deque()
+        self.commands = deque()
+        self.targets = {}
+        self.message_count = 0
+        self.sequence = 0  # Orders commands after the messages queued before them
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def __len__(self):
+        return len(self.protocol) + len(self.commands) + self.message_count
+
+    def clear(self):
+        self.protocol.clear()
+        self.commands.clear()
+        self.targets.clear()
+        self.message_count = 0
+
+    def push(self, command, target, data, quiet=False):
+        """ Queues encoded line data for a command and its target. """
+        entry = (data, quiet, monotonic(), self.sequence)
+        self.sequence += 1
+        if command in PROTOCOL_COMMANDS:
+            self.protocol.append(entry)
+        elif command in MESSAGE_COMMANDS and target:
+            if target not in self.targets:
+                self.targets[target] = deque()
+            self.targets[target].append(entry)
+            self.message_count += 1
+        else:
+            self.commands.append(entry)
+
+    def _take_messages(self, count, before=float('inf')):
+        """ Takes up to count messages queued before the sequence number before, one per target in turn. """
+        taken = []
+        while count > len(taken) and self.targets:
+            target = next((target for target, queue in self.targets.items() if queue[0][3] < before), None)
+            if target is None:
+                break
+            queue = self.targets.pop(target)
+            taken.append(queue.popleft())
+            if queue:
+                self.targets[target] = queue  # Move the target to the end of the rotation
+        self.message_count -= len(taken)
+        return taken
+
+    def pop(self):
+        """ Returns the (data, quiet) entries which may be sent now, in send order. """
+        count = min(self.bucket.available(), len(self))
+        if not count:
+            return []
+
+        taken = []
+        while self.protocol and len(taken) < count:
+            taken.append(self.protocol.popleft())
+        while len(taken) < count:
+            if messages := self._take_messages(1, self.commands[0][3] if self.commands else float('inf')):
+                taken += messages
+            else:  # No messages were queued before the next command
+                taken.append(self.commands.popleft())
+
+        self.bucket.take(len(taken))
+        now = monotonic()
+        for _, _, queued, _ in taken:
+            wait = now - queued
+            self.wait_total += wait
+            if wait > self.wait_max:
+                self.wait_max = wait
+        self.wait_count += len(taken)
+        return [(data, quiet) for data, quiet, _, _ in taken]
+
+    def next_delay(self):
+        """ Returns the seconds until a queued line can be sent, or None if nothing is queued. """
+        if not len(self):
+            return None
+        return self.bucket.delay()
+
+    def stats(self):
+        """ Returns queue depths and wait time metrics. """
+        return {'protocol': len(self.protocol),
+                'commands': len(self.commands),
+                'messages': self.message_count,
+                'targets': len(self.targets),
+                'sent': self.wait_count,
+                'wait_avg': self.wait_total / self.wait_count if self.wait_count else 0.0,
+                'wait_max': self.wait_max}
@@ -0,0 +1,230 @@
+"""
+Records raw traffic to segmented binary logs, with an index for searching them by channel, nick and time.
+
+Each segment is a set of files named by the time of its first record, in milliseconds:
+    <start>.log   records of a struct RECORD header (time, direction, length) followed by the raw line
+    <start>.idx   an INDEX entry (time, log offset, channel id, nick id) per record, in the order they were written
+    <start>.keys  the casefolded channel and nick names, one per line, ids count from 1 in the order they are listed
+    <start>.post  written when the segment is sealed, the record numbers of each key, see write_postings
+"""
+
+from array import array
+from bisect import bisect_left
+from json import dumps, loads
+from mmap import mmap, ACCESS_READ
+from pathlib import Path
+from struct import Struct
+from time import time
+
+from .isupport import CASEMAPPINGS
+
+
+RECORD = Struct('<dBH')
+INDEX = Struct('<dIII')
+POSTINGS_HEADER = Struct('<I')
+INCOMING, OUTGOING = 0, 1
+
+
+def write_postings(path, keys, postings):
+    """
+    Writes the postings of a segment: a header length, a JSON header of {key: [start, count]},
+    then the record numbers of every key as unsigned ints, start being an index into them.
+    """
+    header, data, start = {}, array('I'), 0
+    for key_id, records in postings.items():
+        header[keys[key_id - 1]] = [start, len(records)]
+        data.extend(records)
+        start += len(records)
+    header_bytes = dumps(header).encode()
+    with open(path, 'wb') as f:
+        f.write(POSTINGS_HEADER.pack(len(header_bytes)) + header_bytes)
+        f.write(data.tobytes())
+
+
+def intersect(first, second):
+    """ Returns the numbers in both of two sorted sequences, by searching the longer one for each of the shorter. """
+    if len(first) > len(second):
+        first, second = second, first
+    common = []
+    for number in first:
+        position = bisect_left(second, number)
+        if position < len(second) and second[position] == number:
+            common.append(number)
+    return common
+
+
+class Recorder:
+    """
+    Appends raw lines to the current segment under path, starting a new one once it reaches segment_size bytes.
+    Channel and nick keys are indexed as they are recorded, and written as postings when a segment is sealed.
+    """
+    INCOMING, OUTGOING = INCOMING, OUTGOING
+
+    def __init__(self, path, segment_size=64 * 1024 * 1024):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.segment = None
+
+    def open_segment(self, timestamp):
+        """ Starts a new segment, named by the time of its first record. """
+        start = int(timestamp * 1000)
+        while (self.path / ('%d.log' % start)).exists():
+            start += 1
+        self.segment = self.path / str(start)
+        self.log_file = open(self.segment.with_suffix('.log'), 'ab')
+        self.index_file = open(self.segment.with_suffix('.idx'), 'ab')
+        self.keys_file = open(self.segment.with_suffix('.keys'), 'a')
+        self.offset = 0
+        self.records = 0
+        self.keys = []
+        self.key_ids = {}
+        self.postings = {}  # key id: array of record numbers
+
+    def key_id(self, key):
+        """ Returns the id of a key in the current segment, adding it if it is new. 0 means no key. """
+        if not key:
+            return 0
+        if (key_id := self.key_ids.get(key)) is None:
+            self.keys.append(key)
+            key_id = self.key_ids[key] = len(self.keys)
+            self.keys_file.write(key + '\n')
+            self.postings[key_id] = array('I')
+        self.postings[key_id].append(self.records)
+        return key_id
+
+    def record(self, raw_line, direction=INCOMING, channel=None, nick=None, timestamp=None):
+        """ Records a raw line, without its line ending, with the casefolded channel and nick it is indexed by. """
+        timestamp = timestamp or time()
+        if self.segment is None:
+            self.open_segment(timestamp)
+        channel_id, nick_id = self.key_id(channel), self.key_id(nick)
+        self.index_file.write(INDEX.pack(timestamp, self.offset, channel_id, nick_id))
+        self.log_file.write(RECORD.pack(timestamp, direction, len(raw_line)) + raw_line)
+        self.offset += RECORD.size + len(raw_line)
+        self.records += 1
+        if self.offset >= self.segment_size:
+            self.seal()
+
+    def flush(self):
+        if self.segment is not None:
+            for f in (self.log_file, self.index_file, self.keys_file):
+                f.flush()
+
+    def seal(self):
+        """ Closes the current segment and writes its postings. """
+        if self.segment is None:
+            return
+        for f in (self.log_file, self.index_file, self.keys_file):
+            f.close()
+        write_postings(self.segment.with_suffix('.post'), self.keys, self.postings)
+        self.segment = None
+
+    close = seal
+
+
+class RecordingReader:
+    """
+    Searches the segments recorded under path, reading them through memory maps.
+    Sealed segments are searched through their postings, and the segment still being written by scanning its index.
+    """
+    def __init__(self, path, casemapping='rfc1459'):
+        self.path = Path(path)
+        self.casemap = CASEMAPPINGS.get(casemapping, CASEMAPPINGS['rfc1459'])
+        self._maps = {}  # segment path: (file size, mmap)
+        self._headers = {}  # segment path: postings header
+        self._scans = {}  # segment path: [records scanned, keys, {key: record numbers}] for unsealed segments
+
+    def segments(self):
+        """ Returns (start time, segment path) for every segment, oldest first. """
+        return sorted((int(log.stem) / 1000, log.with_suffix('')) for log in self.path.glob('*.log') if log.stem.isdigit())
+
+    def _map(self, path):
+        """ Returns a memory map of a file, remapping it if it grew. """
+        size = path.stat().st_size if path.exists() else 0
+        if not size:
+            return None
+        cached = self._maps.get(path)
+        if cached is None or cached[0] != size:
+            with open(path, 'rb') as f:
+                cached = self._maps[path] = (size, mmap(f.fileno(), 0, access=ACCESS_READ))
+        return cached[1]
+
+    def _key_records(self, segment, key, index):
+        """ Returns the record numbers for a key in a segment, or None if it does not appear in it. """
+        postings_path = segment.with_suffix('.post')
+        if postings_map := self._map(postings_path):
+            if segment not in self._headers:
+                header_size = POSTINGS_HEADER.unpack_from(postings_map)[0]
+                self._headers[segment] = (POSTINGS_HEADER.size + header_size,
+                                          loads(postings_map[POSTINGS_HEADER.size:POSTINGS_HEADER.size + header_size]))
+            data_start, header = self._headers[segment]
+            if key not in header:
+                return None
+            start, count = header[key]
+            return memoryview(postings_map)[data_start + start * 4:data_start + (start + count) * 4].cast('I')
+
+        # Unsealed segments are scanned once, then only the records added since are scanned
+        scanned, keys, postings = self._scans.setdefault(segment, [0, [], {}])
+        records = len(index) // INDEX.size
+        if records > scanned:
+            keys_path = segment.with_suffix('.keys')
+            keys[:] = keys_path.read_text().splitlines() if keys_path.exists() else []
+            for number, (_, _, channel_id, nick_id) in enumerate(INDEX.iter_unpack(index[scanned * INDEX.size:]), scanned):
+                if max(channel_id, nick_id) > len(keys):
+                    break  # The keys file has not been flushed this far yet
+                for key_id in (channel_id, nick_id):
+                    if key_id:
+                        postings.setdefault(keys[key_id - 1], array('I')).append(number)
+                self._scans[segment][0] = number + 1
+        return postings.get(key)
+
+    def search(self, channel=None, nick=None, since=None, until=None, direction=None):
+        """
+        Yields (time, direction, raw line) for records matching every given filter, oldest first.
+        channel and nick are casefolded, since and until are unix timestamps.
+        """
+        segments = self.segments()
+        for number, (start, segment) in enumerate(segments):
+            if until is not None and start > until:
+                break
+            if since is not None and number + 1 < len(segments) and segments[number + 1][0] < since:
+                continue
+            index_map, log_map = self._map(segment.with_suffix('.idx')), self._map(segment.with_suffix('.log'))
+            if index_map is None or log_map is None:
+                continue
+            index = memoryview(index_map)[:len(index_map) - len(index_map) % INDEX.size]
+            records = range(len(index) // INDEX.size)
+            for key in (channel, nick):
+                if key is None:
+                    continue
+                key_records = self._key_records(segment, key.translate(self.casemap), index)
+                if key_records is None:
+                    records = ()
+                    break
+                if isinstance(records, range):
+                    records = key_records
+                else:
+                    records = intersect(records, key_records)
+            if not records:
+                continue
+
+            def record_time(record):
+                return INDEX.unpack_from(index, record * INDEX.size)[0]
+            first = bisect_left(records, since, key=record_time) if since is not None else 0
+            for record in records[first:]:
+                timestamp, offset, _, _ = INDEX.unpack_from(index, record * INDEX.size)
+                if until is not None and timestamp > until:
+                    break
+                if offset + RECORD.size > len(log_map):
+                    break  # The log has not been flushed this far yet
+                _, record_direction, length = RECORD.unpack_from(log_map, offset)
+                if direction is None or record_direction == direction:
+                    yield timestamp, record_direction, bytes(log_map[offset + RECORD.size:offset + RECORD.size + length])
+
+    def close(self):
+        self._headers.clear()
+        self._scans.clear()
+        for _, mapped in self._maps.values():
+            mapped.close()
+        self._maps.clear()
@@ -0,0 +1,243 @@
+"""
+Routes PRIVMSGs to bot commands, through a prefix trie and a combined regex prefilter.
+"""
+
+from fnmatch import translate
+from inspect import getattr_static, isawaitable, iscoroutinefunction
+from logging import getLogger
+from re import compile, escape, IGNORECASE, VERBOSE
+import asyncio
+
+
+ESCAPE_DIGITS = {'x': 2, 'u': 4, 'U': 8}  # Hex digits following each escape
+
+
+def escape_end(source, char, index):
+    """ Returns the index after the arguments of the escape char, such as the hex digits of \\x41 or the name of \\N{...}. """
+    if char in ESCAPE_DIGITS:
+        return index + ESCAPE_DIGITS[char]
+    if char == 'N' and source[index:index + 1] == '{':
+        return source.find('}', index) + 1 or len(source)
+    if char.isdigit():  # Octal escapes and group references have up to three digits
+        end = index + 2
+        while index < end and source[index:index + 1].isdigit():
+            index += 1
+    return index
+
+
+def required_literal(pattern):
+    """
+    Returns the longest run of literal text every match of a compiled regex contains, lowercased,
+    or '' if there is none or the pattern is too complex to tell, such as with alternations.
+    """
+    source = pattern.pattern
+    if pattern.flags & VERBOSE or '|' in source:
+        return ''
+    best, run, depth, index = '', '', 0, 0
+    while index < len(source):
+        char, index = source[index], index + 1
+        if char == '\\':
+            char, index = source[index:index + 1], index + 1
+            if char.isalnum() or depth:  # \b, \d, \1 and others are not literal text
+                index = escape_end(source, char, index)
+                best, run = max(best, run, key=len), ''
+                continue
+        elif char == '[':
+            index += 1 if source[index:index + 1] == '^' else 0
+            index += 1 if source[index:index + 1] == ']' else 0  # A leading ] is part of the set
+            while index < len(source) and source[index] != ']':
+                index += 2 if source[index] == '\\' else 1
+            index += 1
+            best, run = max(best, run, key=len), ''
+            continue
+        elif char in '*?{':  # The last character is optional
+            best, run = max(best, run[:-1], key=len), ''
+            if char == '{':
+                index = source.find('}', index) + 1 or len(source)
+            continue
+        elif char in '()':
+            depth += 1 if char == '(' else -1
+            best, run = max(best, run, key=len), ''
+            continue
+        elif char in '.^$+' or depth:
+            best, run = max(best, run, key=len), ''
+            continue
+        run += char
+    return max(best, run, key=len).lower()
+
+
+def trie_pattern(node):
+    """ Returns regex source matching the words in a trie of characters, factored so it is searched quickly. """
+    alternatives = [escape(char) + trie_pattern(child) for char, child in sorted(node.items(), key=str) if char is not None]
+    if not alternatives:
+        return ''
+    if len(alternatives) == 1 and None not in node:
+        return alternatives[0]
+    return '(?:%s)%s' % ('|'.join(alternatives), '?' if None in node else '')
+
+
+def route(command=None, prefix='!', startswith=None, regex=None, flags=0, hostmask=None, channel=None):
+    """
+    Marks a method as a route, added to the client's router when it is created.
+    Use command for prefixed commands such as !ping, startswith for any other text prefix, or regex.
+    """
+    def decorator(func):
+        func._routes = getattr(func, '_routes', ()) + (dict(command=command, prefix=prefix, startswith=startswith,
+                                                              regex=regex, flags=flags, hostmask=hostmask, channel=channel),)
+        return func
+    return decorator
+
+
+class Route:
+    """ A registered trigger, with the filters checked once its text matches. """
+    __slots__ = ('func', 'text', 'word', 'pattern', 'hostmask', 'channel')
+
+    def __init__(self, func, text=None, word=False, pattern=None, hostmask=None, channel=None):
+        self.func = func
+        self.text = text
+        self.word = word  # Text must be followed by a space or the end of the message
+        self.pattern = pattern
+        self.hostmask = compile(translate(hostmask), IGNORECASE) if hostmask else None
+        self.channel = channel
+
+    def __repr__(self):
+        return "<Route %s -> %s>" % (self.text or self.pattern.pattern, getattr(self.func, '__name__', self.func))
+
+
+class Router:
+    """
+    Text prefixes are kept in a trie, so matching them costs the length of the longest prefix, however many there are.
+    Regexes are prefiltered by a literal each of their matches must contain, such as keyword in \\bkeyword\\d+.
+    The literals are combined into one alternation, factored into a trie so a message is searched once,
+    and only regexes whose literal was found, or which have none, are searched.
+    The regex matching earliest in the message wins, ties going to the route added first.
+    Hostmask globs and channels are only checked for routes whose text matched.
+    fold casefolds channels before they are compared, it defaults to str.lower. Hostmask globs are matched ignoring case.
+    offload, if set, wraps coroutine routes when they are added, such as to run them in the client's executor.
+    Otherwise they are run as tasks, which are kept until they finish.
+    Errors raised by routes are logged, so they don't stop other routes or the PRIVMSG handler.
+    """
+    def __init__(self, fold=str.lower, logger=None, offload=None):
+        self.fold = fold
+        self.logger = logger or getLogger(__name__)
+        self.offload = offload
+        self.tasks = set()
+        self.trie = {}  # char: child node, None: routes ending here
+        self.regex_routes = []
+        self.literal_trie = {}  # char: child node, None: indexes of regex routes containing the literal ending here
+        self.prefilter = None
+        self.unfiltered = []  # Indexes of regex routes without a literal
+        self.compiled = True
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, func, command=None, prefix='!', startswith=None, regex=None, flags=0, hostmask=None, channel=None):
+        """
+        Adds a route calling func(msg, args) for a command or text prefix, or func(msg, match) for a regex.
+        args is the rest of the message after the command or prefix.
+        """
+        channel = self.fold(channel) if channel else None
+        if self.offload and iscoroutinefunction(func):
+            func = self.offload(func)
+        if command or startswith:
+            text = prefix + command if command else startswith
+            node = self.trie
+            for char in text:
+                node = node.setdefault(char, {})
+            node.setdefault(None, []).append(Route(func, text, bool(command), hostmask=hostmask, channel=channel))
+        elif regex:
+            self.regex_routes.append(Route(func, pattern=compile(regex, flags), hostmask=hostmask, channel=channel))
+            self.compiled = False
+        else:
+            raise ValueError("A route needs a command, startswith or regex.")
+        self.count += 1
+
+    def add_routes(self, obj):
+        """ Adds the methods of obj marked with @route. """
+        for name in dir(type(obj)):
+            if routes := getattr(getattr_static(obj, name, None), '_routes', None):
+                for kwargs in routes:
+                    self.add(getattr(obj, name), **kwargs)
+
+    def compile(self):
+        """ Builds the literal prefilter for the regex routes. """
+        self.literal_trie, self.unfiltered = {}, []
+        for index, regex_route in enumerate(self.regex_routes):
+            if len(literal := required_literal(regex_route.pattern)) < 2:
+                self.unfiltered.append(index)
+                continue
+            node = self.literal_trie
+            for char in literal:
+                node = node.setdefault(char, {})
+            node.setdefault(None, []).append(index)
+        self.prefilter = compile('(?=%s)' % trie_pattern(self.literal_trie)) if self.literal_trie else None
+        self.compiled = True
+
+    def candidates(self, text):
+        """ Returns the indexes of regex routes which may match text, in the order they were added. """
+        found = set(self.unfiltered)
+        if self.prefilter:
+            lowered = text.lower()
+            for position in self.prefilter.finditer(lowered):
+                node = self.literal_trie
+                for char in lowered[position.start():]:
+                    if (node := node.get(char)) is None:
+                        break
+                    found.update(node.get(None, ()))
+        return sorted(found)
+
+    def allowed(self, route, msg, channel):
+        if route.channel and route.channel != channel:
+            return False
+        if route.hostmask and not (msg.source and route.hostmask.match(msg.source)):
+            return False
+        return True
+
+    def call(self, func, msg, arg):
+        try:
+            result = func(msg, arg)
+        except Exception as e:
+            return self.logger.exception("Route %s failed: %s", getattr(func, '__name__', func), e)
+        if isawaitable(result):
+            task = asyncio.ensure_future(result)
+            self.tasks.add(task)
+            task.add_done_callback(self.task_done)
+
+    def task_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and (e := task.exception()):
+            self.logger.error("Route task failed: %s", e, exc_info=e)
+
+    def route(self, msg):
+        """ Runs the routes matching a PRIVMSG, returning how many ran. """
+        if not self.compiled:
+            self.compile()
+        text, channel, ran = msg.params[1], self.fold(msg.params[0]), 0
+
+        node = self.trie
+        for position, char in enumerate(text):
+            if (node := node.get(char)) is None:
+                break
+            if routes := node.get(None):
+                rest = text[position + 1:]
+                for prefix_route in routes:
+                    if prefix_route.word and rest and rest[0] != ' ':
+                        continue
+                    if self.allowed(prefix_route, msg, channel):
+                        self.call(prefix_route.func, msg, rest.lstrip(' '))
+                        ran += 1
+
+        if not self.regex_routes:
+            return ran
+        best = None
+        for index in self.candidates(text):
+            regex_route = self.regex_routes[index]
+            if (match := regex_route.pattern.search(text)) and self.allowed(regex_route, msg, channel):
+                if best is None or match.start() < best[1].start():
+                    best = (regex_route, match)
+        if best:
+            self.call(best[0].func, msg, best[1])
+            ran += 1
+        return ran
@@ -0,0 +1,138 @@
+"""
+Bounded per-channel message history.
+"""
+
+from array import array
+from collections import deque
+from pathlib import Path
+from time import time
+
+
+class ScrollbackEntry:
+    """ A single message in a channel's history. seq is its position in the scrollback, if it was appended to one. """
+    __slots__ = ('time', 'nick', 'text', 'seq')
+
+    def __init__(self, nick, text, timestamp=None, seq=None):
+        self.time = timestamp or time()
+        self.nick = nick
+        self.text = text
+        self.seq = seq
+
+    def __repr__(self):
+        return "<ScrollbackEntry %.3f <%s> %s>" % (self.time, self.nick, self.text)
+
+    def encode(self):
+        return "%.3f\t%s\t%s\n" % (self.time, self.nick, self.text)
+
+    @classmethod
+    def decode(cls, line):
+        timestamp, nick, text = line.rstrip('\n').split('\t', 2)
+        return cls(nick, text, float(timestamp))
+
+
+class Scrollback:
+    """
+    Keeps the last size entries of a channel in a ring buffer.
+    If a spill_path is set, evicted entries are appended to it, and can be paged back in with page().
+    Every checkpoint_interval'th line offset of the spill file is indexed, so paging only reads what it returns.
+    """
+    checkpoint_interval = 256
+
+    def __init__(self, size=1000, spill_path=None):
+        if size < 1:
+            raise ValueError("Scrollback size must be at least 1: %s" % size)
+        self.size = size
+        self.entries = deque(maxlen=size)
+        self.count = 0  # Entries appended since creation, the sequence number of the next entry
+        self.spill_path = Path(spill_path) if spill_path else None
+        self._spill_file = None
+        self._spilled = None  # Lines in the spill file, once indexed
+        self._spill_size = 0
+        self._checkpoints = array('Q')
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def append(self, nick, text, timestamp=None):
+        """ Adds an entry, spilling the oldest entry if the buffer is full. """
+        if self.spill_path and len(self.entries) == self.size:
+            self.spill(self.entries[0])
+        self.entries.append(ScrollbackEntry(nick, text, timestamp, self.count))
+        self.count += 1
+
+    def since(self, seq):
+        """
+        Returns the buffered entries with a sequence number of at least seq.
+        Works from a snapshot of the buffer, so it can be used while another thread appends.
+        """
+        entries = list(self.entries)
+        if not entries:
+            return entries
+        start = seq - entries[0].seq
+        return entries[start:] if start > 0 else entries
+
+    def _index_spill(self):
+        """ Scans an existing spill file for line offsets, once. """
+        if self._spilled is not None:
+            return
+        self._spilled = 0
+        if not self.spill_path.exists():
+            return
+        with open(self.spill_path, 'rb') as f:
+            offset = 0
+            for line in f:
+                if not self._spilled % self.checkpoint_interval:
+                    self._checkpoints.append(offset)
+                offset += len(line)
+                self._spilled += 1
+        self._spill_size = offset
+
+    def spill(self, entry):
+        """ Appends an entry to the spill file. """
+        self._index_spill()
+        if self._spill_file is None:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            self._spill_file = open(self.spill_path, 'ab', buffering=0)
+        data = entry.encode().encode()
+        if not self._spilled % self.checkpoint_interval:
+            self._checkpoints.append(self._spill_size)
+        self._spill_file.write(data)
+        self._spill_size += len(data)
+        self._spilled += 1
+
+    @property
+    def spilled(self):
+        """ Number of entries in the spill file. """
+        if not self.spill_path:
+            return 0
+        self._index_spill()
+        return self._spilled
+
+    def page(self, end=None, count=100):
+        """ Reads up to count spilled entries before spill line end, defaulting to the newest. """
+        if not self.spill_path:
+            return []
+        self._index_spill()
+        end = self._spilled if end is None else min(end, self._spilled)
+        start = max(end - count, 0)
+        if start >= end:
+            return []
+
+        checkpoint = start // self.checkpoint_interval
+        entries = []
+        with open(self.spill_path, 'rb') as f:
+            f.seek(self._checkpoints[checkpoint])
+            for index in range(checkpoint * self.checkpoint_interval, end):
+                line = f.readline()
+                if index >= start:
+                    entries.append(ScrollbackEntry.decode(line.decode()))
+        return entries
+
+    def close(self):
+        """ Closes the spill file, it is reopened if more entries are spilled. """
+        if self._spill_file:
+            self._spill_file.close()
+            self._spill_file = None
@@ -0,0 +1,42 @@
+"""
+On-disk cache of server state, used to fill state at startup while the live data arrives.
+"""
+
+from json import load, dump
+from pathlib import Path
+from time import time
+
+
+class SessionCache:
+    """
+    Server state saved to a JSON file, keyed by server so clients can share a file.
+    Each entry holds the ISUPPORT tokens, server_info, the joined channels and their members.
+    The file is read again before saving, so entries saved by other clients are kept.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.servers = {}
+        self.load()
+
+    def load(self):
+        """ Loads the cache file, an unreadable or missing file is treated as empty. """
+        try:
+            with open(self.path) as f:
+                servers = load(f)
+        except (OSError, ValueError):
+            servers = {}
+        self.servers = servers if isinstance(servers, dict) else {}
+
+    def get(self, server):
+        """ Returns the cached state of a server, or an empty dict. """
+        return self.servers.get(server, {})
+
+    def save(self, server, state):
+        """ Saves the state of a server, replacing the file atomically. """
+        self.load()
+        self.servers[server] = dict(state, saved=time())
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(temp_path, 'w') as f:
+            dump(self.servers, f)
+        temp_path.replace(self.path)
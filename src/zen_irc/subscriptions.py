@@ -0,0 +1,89 @@
+"""
+Async subscriptions to received messages.
+"""
+
+from asyncio import Queue, QueueEmpty, QueueFull
+import re
+
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'error')
+_CLOSED = object()
+
+
+class SubscriptionOverflow(Exception):
+    """ Raised to a consumer whose subscription overflowed with the 'error' policy. """
+
+
+class MessageSubscription:
+    """
+    Async iterator of messages, optionally filtered to a channel and a regex pattern on the text.
+    Messages are handed over through a bounded asyncio.Queue. When it is full, the overflow policy either
+    drops the oldest queued message, drops the new message, or ends the subscription with SubscriptionOverflow.
+    Can be used as an async context manager, which unsubscribes on exit.
+    """
+    def __init__(self, client, channel=None, pattern=None, maxsize=1000, overflow='drop_oldest'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy: %s" % overflow)
+        self.client = client
+        self.channel = client.members.fold(channel) if channel else None
+        self.pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+        self.overflow = overflow
+        self.queue = Queue(maxsize)
+        self.dropped = 0
+        self.closed = False
+
+    def matches(self, msg):
+        if self.channel and self.client.members.fold(msg.params[0]) != self.channel:
+            return False
+        if self.pattern and not self.pattern.search(msg.params[-1]):
+            return False
+        return True
+
+    def put(self, msg):
+        """ Queues a message for the consumer, applying the overflow policy if the queue is full. """
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(msg)
+        except QueueFull:
+            self.dropped += 1
+            if self.overflow == 'drop_oldest':
+                self.queue.get_nowait()
+                self.queue.put_nowait(msg)
+            elif self.overflow == 'error':
+                self.close(SubscriptionOverflow("Subscription queue overflowed at %d messages" % self.queue.maxsize))
+
+    def close(self, error=None):
+        """ Ends the subscription after queued messages are consumed, raising error to the consumer if set. """
+        if self.closed:
+            return
+        self.closed = True
+        self.client.unsubscribe(self)
+        if error:  # Drop queued messages so the consumer sees the error next
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except QueueEmpty:
+                    break
+        elif self.queue.full():  # The consumer is not waiting, and stops once the queue is empty
+            return
+        self.queue.put_nowait(error or _CLOSED)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed and self.queue.empty():
+            raise StopAsyncIteration
+        msg = await self.queue.get()
+        if msg is _CLOSED:
+            raise StopAsyncIteration
+        if isinstance(msg, Exception):
+            raise msg
+        return msg
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,91 @@
+"""
+Lazily parsed IRCv3 message tags.
+"""
+
+from collections.abc import Mapping
+from irctokens import tokenise
+
+
+TAG_ESCAPES = {':': ';', 's': ' ', '\\': '\\', 'r': '\r', 'n': '\n'}
+
+
+def unescape_tag(value):
+    """ Unescapes an IRCv3 tag value. """
+    if '\\' not in value:
+        return value
+    unescaped = []
+    chars = iter(value)
+    for char in chars:
+        if char == '\\':
+            if (escaped := next(chars, None)) is not None:
+                unescaped.append(TAG_ESCAPES.get(escaped, escaped))
+        else:
+            unescaped.append(char)
+    return ''.join(unescaped)
+
+
+class LazyTags(Mapping):
+    """
+    Message tags which are only parsed when they are used.
+    get() and the in operator check the raw tag string first, so lookups of absent tags stay cheap,
+    and truthiness only checks that the raw string is not empty.
+    """
+    __slots__ = ('raw', '_parsed')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._parsed = None
+
+    def _parse(self):
+        if self._parsed is None:
+            self._parsed = {}
+            for tag in self.raw.split(';'):
+                if tag:
+                    key, _, value = tag.partition('=')
+                    self._parsed[key] = unescape_tag(value)
+        return self._parsed
+
+    def __getitem__(self, key):
+        return self._parse()[key]
+
+    def __iter__(self):
+        return iter(self._parse())
+
+    def __len__(self):
+        return len(self._parse())
+
+    def __bool__(self):
+        return bool(self.raw)
+
+    def __contains__(self, key):
+        if self._parsed is None and key not in self.raw:
+            return False
+        return key in self._parse()
+
+    def get(self, key, default=None):
+        if self._parsed is None and key not in self.raw:
+            return default
+        return self._parse().get(key, default)
+
+    def __repr__(self):
+        return "LazyTags(%r)" % self.raw
+
+
+def tokenise_line(raw_line):
+    """ Tokenises a raw line, leaving any tags unparsed until they are used. """
+    if raw_line[:1] != b'@':
+        return tokenise(raw_line)
+    raw_tags, _, rest = raw_line.partition(b' ')
+    line = tokenise(rest)
+    line.tags = LazyTags(raw_tags[1:].decode('utf8', 'replace'))
+    return line
+
+
+def message_time(msg):
+    """ Returns the server-time of a message as a timestamp, or None if it has none. """
+    if msg.tags and (server_time := msg.tags.get('time')):
+        from datetime import datetime
+        try:
+            return datetime.fromisoformat(server_time).timestamp()
+        except ValueError:
+            return None
@@ -0,0 +1,116 @@
+"""
+Packing of command targets into comma separated lists.
+"""
+
+LINE_LIMIT = 512  # Including the trailing \r\n
+
+
+def _length(text):
+    return len(text.encode())
+
+
+def pack_targets(command, targets, params=(), max_targets=None, line_limit=LINE_LIMIT, reserved=0):
+    """
+    Packs targets into comma separated lists for a command, such as PRIVMSG #a,#b :text.
+    Each list stays within max_targets, and each line within line_limit bytes, less reserved bytes.
+    params are the parameters which follow the targets, the last one is sent as a trailing parameter.
+    Duplicate targets are dropped. Returns a list of target lists.
+    """
+    base = reserved + _length(command) + 1 + sum(1 + _length(param) for param in params) + (1 if params else 0) + 2
+    packed, line, length, seen = [], [], base, set()
+    for target in targets:
+        if target in seen:
+            continue
+        seen.add(target)
+        added = _length(target) + (1 if line else 0)
+        if base + _length(target) > line_limit:
+            raise ValueError("Target does not fit in a %s line: %s" % (command, target))
+        if line and (length + added > line_limit or len(line) == max_targets):
+            packed.append(line)
+            line, length, added = [], base, _length(target)
+        line.append(target)
+        length += added
+    if line:
+        packed.append(line)
+    return packed
+
+
+def split_text(command, target, text, line_limit=LINE_LIMIT, reserved=0):
+    """
+    Splits message text into chunks which each fit in a line to target, such as PRIVMSG #a :chunk.
+    reserved is the length of the :nick!user@host prefix the server adds when it relays the line.
+    Chunks end at the last space which fits, dropping it, or are cut between characters if there is none.
+    """
+    budget = line_limit - reserved - _length(command) - _length(target) - 5  # The spaces, the : and \r\n
+    if budget < 1:
+        raise ValueError("Target does not fit in a %s line: %s" % (command, target))
+    data = text.encode()
+    chunks = []
+    while len(data) > budget:
+        cut = budget
+        while cut and data[cut] & 0xC0 == 0x80:  # Don't cut a multibyte character
+            cut -= 1
+        if (space := data.rfind(b' ', 0, cut + 1)) > 0:
+            chunks.append(data[:space].decode())
+            data = data[space + 1:]
+        else:
+            chunks.append(data[:cut].decode())
+            data = data[cut:]
+    if data or not chunks:
+        chunks.append(data.decode())
+    return chunks
+
+
+def pack_joins(channels, max_targets=None, line_limit=LINE_LIMIT):
+    """
+    Packs (channel, key) pairs into JOIN parameters, such as ['#a,#b,#c', 'key_a,key_b'].
+    Keys apply to channels by position, so keyed channels are listed first.
+    Each line stays within max_targets channels and line_limit bytes.
+    Duplicate channels are dropped, keeping the first key given.
+    """
+    keys, order = {}, []
+    for channel, key in channels:
+        if channel not in keys:
+            keys[channel] = key
+            order.append(channel)
+    order = [channel for channel in order if keys[channel]] + [channel for channel in order if not keys[channel]]
+
+    base = len("JOIN ") + 2
+    packed, line_channels, line_keys, length = [], [], [], base
+    for channel in order:
+        key = keys[channel]
+        added = _length(channel) + (1 if line_channels else 0)
+        key_added = _length(key) + 1 if key else 0  # The space before the keys, or the comma between them
+        if base + _length(channel) + (_length(key) + 1 if key else 0) > line_limit:
+            raise ValueError("Channel does not fit in a JOIN line: %s" % channel)
+        if line_channels and (length + added + key_added > line_limit or len(line_channels) == max_targets):
+            packed.append([",".join(line_channels)] + ([",".join(line_keys)] if line_keys else []))
+            line_channels, line_keys, length = [], [], base
+            added = _length(channel)
+            key_added = _length(key) + 1 if key else 0
+        line_channels.append(channel)
+        if key:
+            line_keys.append(key)
+        length += added + key_added
+    if line_channels:
+        packed.append([",".join(line_channels)] + ([",".join(line_keys)] if line_keys else []))
+    return packed
+
+
+def merge_commands(commands):
+    """
+    Merges consecutive queued commands which can share a line, keeping their order.
+    commands is a list of (command, target, arg) tuples, where arg is a JOIN key, PART reason or message text.
+    Consecutive JOINs merge, as do PARTs with the same reason and PRIVMSG/NOTICEs with the same text to new targets.
+    Returns a list of (command, [(target, arg), ...]) groups.
+    """
+    groups = []
+    for command, target, arg in commands:
+        if groups:
+            last_command, entries = groups[-1]
+            if last_command == command and (command == 'JOIN' or (
+                    entries[0][1] == arg and all(entry[0] != target for entry in entries))):
+                entries.append((target, arg))
+                continue
+        groups.append((command, [(target, arg)]))
+    return groups
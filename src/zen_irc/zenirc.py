@@ -2,127 +2,754 @@ from zenlib.logging import ClassLogger, log_call
 
 from .baseirchandlers import BaseIRCHandlers
 from .extendedirchandlers import ExtendedIRCHandlers
+from .ircv3handlers import IRCv3Handlers
 from .irccommands import IRCCommands
+from .handlerregistry import HandlerRegistry
+from .ratelimit import OutboundScheduler, PROTOCOL_COMMANDS
+from .linebuffer import LineBuffer
+from .inbound import InboundScheduler, FAST_COMMANDS, CHURN_COMMANDS, raw_command
+from .members import MembershipIndex
+from .isupport import ISupport
+from .scrollback import Scrollback
+from .metrics import Metrics, NullMetrics
+from .executor import OrderedExecutor
+from .router import Router
+from .subscriptions import MessageSubscription
+from .tags import tokenise_line, message_time
 
-from tomllib import load
-from irctokens import StatefulDecoder, StatefulEncoder
+from inspect import ismethod
+from pathlib import Path
 from threading import Lock, Event
-from queue import Queue
+from random import uniform
+from time import monotonic
 import asyncio
 
 
-class ZenIRC(ClassLogger, BaseIRCHandlers, ExtendedIRCHandlers, IRCCommands):
+SEND_QUEUE_WARN_INTERVAL = 10.0  # Seconds between warnings while the send queue is full
+
+
+class ZenIRC(ClassLogger, BaseIRCHandlers, ExtendedIRCHandlers, IRCv3Handlers, IRCCommands, HandlerRegistry):
     def __init__(self, config="config.toml", *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.config_file = config
-        self.load_config()
+        if isinstance(config, dict):
+            self.config_file = None
+            self.config = config
+        else:
+            self.config_file = config
+            self.load_config()
 
-        self.encoder = StatefulEncoder()
-        self.decoder = StatefulDecoder()
+        self.nickname = self.config.get('user')  # Updated by nick() and the NICK handler
+        self.userhost = None  # Our user@host as the server relays it, seen when we join a channel
+        self.line_buffer = LineBuffer(self.config.get('read_size', 4096), max_read_size=self.config.get('max_read_size', 8192))
+        self.inbound = InboundScheduler(self.config.get('inbound_burst_threshold', 200), self.config.get('inbound_queue_limit', 20000),
+                                        self.config.get('inbound_time_slice', 0.01))
         self.channels = {}
         self._channels = {}  # For removed channels
-        self.message_queue = Queue()
+        self.members = MembershipIndex()
+        self.isupport = ISupport()
+        self.scrollback_size = self.config.get('scrollback', 1000)
+        self.scrollback_dir = self.config.get('scrollback_dir')
+        self.subscriptions = []
+        self.message_queue_size = self.config.get('message_queue_size', 1000)
+        self.message_overflow = self.config.get('message_overflow', 'drop_oldest')
 
         self.motd_start = Event()
-        self.stop_cmd = ['QUIT']
+        self.stop_cmd = frozenset(['QUIT'])
         self.send_lock = Lock()
+        self.send_queue = OutboundScheduler(self.config.get('flood_burst', 5), self.config.get('flood_rate', 1.0))
+        self.send_queue_limit = self.config.get('send_queue_limit', 1024)
+        self.send_queue_peak = 0
+        self.send_queue_dropped = 0  # Lines dropped since the last warning
+        self.send_queue_warned = None  # When the last full queue warning was logged
+        self.send_ready = asyncio.Event()
+        self.send_space = asyncio.Event()
+        self.send_space.set()
+        self.loop = None
+        self.pending_commands = []
         self.reader_done = asyncio.Event()
+        self.stopped = asyncio.Event()
+        self.registered = asyncio.Event()
+        self.ready = asyncio.Event()
+        self.names_pending = set()
+        self.names_stale = set()
+        self.connect_time = None
+        self.startup_time = None
+        self.server_info = {}
+        self.reconnect = self.config.get('reconnect', True)
+        self.reconnect_delay = self.config.get('reconnect_delay', 5)
+        self.reconnect_max_delay = self.config.get('reconnect_max_delay', 300)
+        self.reconnect_attempts = 0
+        self.connects = 0
+        self.ping_interval = self.config.get('ping_interval', 120)
+        self.ping_timeout = self.config.get('ping_timeout', 60)
+        self.last_received = None
+        self.capabilities_wanted = self.config.get('capabilities', ['multi-prefix', 'server-time', 'batch', 'away-notify'])
+        self.capabilities_available = {}
+        self.capabilities = set()
+        self.batches = {}
+        self.away_nicks = set()
+        self.lines_received = 0
+        self.metrics_port = self.config.get('metrics_port')
+        self.metrics_server = None
+        self.metrics = Metrics() if self.config.get('metrics') or self.metrics_port else NullMetrics()
+        self.recorder = None
+        if self.config.get('record_dir'):
+            from .recorder import Recorder
+            self.recorder = Recorder(Path(self.config['record_dir']) / self.config['server'],
+                                     self.config.get('record_segment_size', 64 * 1024 * 1024))
+        self.executor = OrderedExecutor(self.logger, self.config.get('handler_threads'), self.config.get('handler_processes'))
+        self.describe_metrics()
+        self.build_handlers()
+        # Churn is only collapsed for commands whose base handler has not been overridden
+        self.churn_commands = frozenset(command for command in CHURN_COMMANDS
+                                        if getattr(type(self), 'handle_' + command) is getattr(BaseIRCHandlers, 'handle_' + command))
+        self.router = Router(lambda name: self.members.fold(name), self.logger, self.offload_route)
+        self.router.add_routes(self)
+
+        self.session_cache = None
+        self.cached_session = {}
+        if self.config.get('session_cache'):
+            from .sessioncache import SessionCache
+            self.session_cache = SessionCache(self.config['session_cache'])
+            self.restore_session()
 
     def load_config(self):
         """ Loads the config file from self.config_file. """
+        from tomllib import load
         self.logger.info('Loading config file: %s' % self.config_file)
         with open(self.config_file, 'rb') as f:
             self.config = load(f)
 
         self.logger.debug('Loaded config: %s' % self.config)
 
+    def new_scrollback(self, channel):
+        """ Creates the scrollback for a channel, spilling to scrollback_dir/<server>/<channel>.log if set. """
+        spill_path = None
+        if self.scrollback_dir:
+            spill_path = Path(self.scrollback_dir) / self.config['server'] / (channel.replace('/', '_') + '.log')
+        return Scrollback(self.scrollback_size, spill_path)
+
+    def describe_metrics(self):
+        """ Describes the client's metrics, and registers gauges for its state. """
+        metrics = self.metrics
+        metrics.describe('lines_received_total', 'Lines received, by command.', 'command')
+        metrics.describe('lines_sent_total', 'Lines written to the server.')
+        metrics.describe('bytes_received_total', 'Bytes read from the server.')
+        metrics.describe('bytes_sent_total', 'Bytes written to the server.')
+        metrics.describe('reconnects_total', 'Reconnect attempts.')
+        metrics.describe('handler_seconds', 'Handler run time, by handler.', 'handler')
+        metrics.describe('send_queue_depth', 'Lines waiting to be written.')
+        metrics.describe('send_queue_peak', 'Most lines waiting to be written at once.')
+        metrics.describe('members', 'Tracked channel memberships.')
+        metrics.describe('startup_seconds', 'Seconds from connecting to joined and ready.')
+        metrics.describe('handlers_pending', 'Offloaded handler calls waiting or running.')
+        metrics.describe('inbound_queue_depth', 'Received lines waiting to be processed.')
+        metrics.describe('inbound_lag_seconds', 'Seconds the oldest received line has waited to be processed.')
+        metrics.describe('inbound_delay_seconds', 'Seconds received lines waited to be processed, sampled per time slice.')
+        metrics.gauge('send_queue_depth', lambda: len(self.send_queue))
+        metrics.gauge('send_queue_peak', lambda: self.send_queue_peak)
+        metrics.gauge('members', lambda: len(self.members))
+        metrics.gauge('startup_seconds', lambda: self.startup_time or 0)
+        metrics.gauge('handlers_pending', lambda: len(self.executor))
+        metrics.gauge('inbound_queue_depth', lambda: len(self.inbound))
+        metrics.gauge('inbound_lag_seconds', lambda: self.inbound.current_lag)
+
+    def offload_handler(self, func, mode):
+        """
+        Returns a function which queues func in the executor, so it runs without blocking the reader.
+        Called by HandlerRegistry for handlers with an async, thread or process mode.
+        Calls for the same channel, or the same nick for other messages, run in the order they were received.
+        Process handlers are run in another process, so they must be staticmethods or plain functions.
+        """
+        if mode == 'process' and ismethod(func):
+            raise TypeError("Process handlers must be staticmethods or functions: %s" % func.__qualname__)
+        executor = self.executor
+
+        def offloaded(msg):
+            executor.submit(self.order_key(msg), mode, func, msg)
+        offloaded.__name__ = getattr(func, '__name__', repr(func))
+        offloaded.__wrapped__ = func
+        return offloaded
+
+    def offload_route(self, func):
+        """ Returns a function which runs a coroutine route in the executor, in order with offloaded handlers for its channel. """
+        executor = self.executor
+
+        def offloaded(msg, arg):
+            def call(msg):
+                return func(msg, arg)
+            call.__name__ = getattr(func, '__name__', repr(func))
+            executor.submit(self.order_key(msg), 'async', call, msg)
+        offloaded.__name__ = getattr(func, '__name__', repr(func))
+        offloaded.__wrapped__ = func
+        return offloaded
+
+    def order_key(self, msg):
+        """ Returns the key offloaded handlers are ordered by, the casefolded channel or source nick of a message. """
+        if msg.params and msg.params[0][:1] in self.isupport.chantypes:
+            return self.members.fold(msg.params[0])
+        if msg.source:
+            return self.members.fold(msg.hostmask.nickname)
+        return ''
+
+    def wrap_handler(self, func):
+        """ Times handlers when metrics are enabled. """
+        return self.metrics.timed('handler_seconds', func, getattr(func, '__name__', None) or repr(func))
+
+    @property
+    def send_queue_depth(self):
+        """ Number of lines waiting to be written. """
+        return len(self.send_queue)
+
     @log_call(20)
     def send(self, msg, quiet=False):
-        """ Sends a message to the IRC server. Locks so it works with asyncio. """
-        self.logger.debug('Encoding message: %s' % msg)
+        """
+        Queues a message for the writer loop. Locks so it can be called from other threads.
+        Lines released by the flood limiter in the same loop tick are written together.
+        Once send_queue_limit lines are queued, lines other than protocol replies such as PONG are dropped,
+        use send_async to wait for space instead.
+        """
+        if self.pending_commands:
+            self.flush_commands()
+        self.logger.debug('Encoding message: %s', msg)
+        data = msg.format().encode() + b'\r\n'
         with self.send_lock:
-            self.encoder.push(msg)
-            while pending_msg := self.encoder.pending():
+            depth = len(self.send_queue)
+            if dropped := (depth >= self.send_queue_limit and msg.command not in PROTOCOL_COMMANDS):
+                self.send_queue_dropped += 1
+            else:
+                self.send_queue.push(msg.command, msg.params[0] if msg.params else None, data, quiet)
+                depth += 1
+                if depth > self.send_queue_peak:
+                    self.send_queue_peak = depth
+        if depth >= self.send_queue_limit:
+            self.warn_send_queue_full(depth)
+        if dropped:
+            if self.metrics.enabled:
+                self.metrics.inc('send_queue_dropped_total')
+            return
+        if self.recorder:
+            if self.in_loop() or self.loop is None:
+                self.record_line(data[:-2], msg, self.recorder.OUTGOING)
+            else:  # The recorder is written from the event loop only
+                self.loop.call_soon_threadsafe(self.record_line, data[:-2], msg, self.recorder.OUTGOING)
+        self.wake_writer()
+
+    def warn_send_queue_full(self, depth):
+        """ Warns that the send queue is full, at most once every SEND_QUEUE_WARN_INTERVAL seconds. """
+        now = monotonic()
+        if self.send_queue_warned is not None and now - self.send_queue_warned < SEND_QUEUE_WARN_INTERVAL:
+            return
+        self.send_queue_warned = now
+        dropped, self.send_queue_dropped = self.send_queue_dropped, 0
+        self.logger.warning('Send queue is at its limit: %d lines, %d dropped', depth, dropped)
+
+    async def send_async(self, msg, quiet=False):
+        """ Sends a message, waiting until the send queue is below send_queue_limit first. """
+        await self.wait_send_space()
+        self.send(msg, quiet=quiet)
+
+    async def wait_send_space(self):
+        """ Waits until the send queue is below send_queue_limit. """
+        while len(self.send_queue) >= self.send_queue_limit:
+            self.send_space.clear()
+            await self.send_space.wait()
+
+    def in_loop(self):
+        """ Returns True when called from the client's running event loop. """
+        try:
+            return self.loop is not None and asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def wake_writer(self):
+        """ Wakes the writer loop, from any thread. """
+        if self.loop is None:
+            return  # The writer loop flushes the queue when it starts
+        if self.in_loop():
+            self.send_ready.set()
+        else:
+            self.loop.call_soon_threadsafe(self.send_ready.set)
+
+    async def writer_loop(self):
+        """
+        Writes all lines the flood limiter releases in one write per wake,
+        then waits for the transport to drain.
+        """
+        self.send_ready.set()
+        while True:
+            await self.send_ready.wait()
+            self.send_ready.clear()
+            with self.send_lock:
+                pending = self.send_queue.pop()
+                delay = self.send_queue.next_delay()
+            if not pending:
+                if delay is not None:  # Lines are queued, but the flood limiter is out of tokens
+                    await asyncio.sleep(delay)
+                    self.send_ready.set()
+                continue
+
+            for data, quiet in pending:
                 log_level = 20 if quiet else 10
-                self.logger.log(log_level, 'Sending message: %s' % pending_msg.decode().strip())
-                self.irc_writer.write(pending_msg)
-                self.encoder.clear()
+                if self.logger.isEnabledFor(log_level):
+                    self.logger.log(log_level, 'Sending message: %s', data.decode().strip())
+            data = b''.join(data for data, _ in pending)
+            self.irc_writer.write(data)
+            if self.metrics.enabled:
+                self.metrics.inc('lines_sent_total', amount=len(pending))
+                self.metrics.inc('bytes_sent_total', amount=len(data))
+            try:
+                await self.irc_writer.drain()
+            except ConnectionError as e:
+                self.logger.warning('Connection lost while writing: %s', e)
+                return self.connection_lost()
+
+            if len(self.send_queue) < self.send_queue_limit:
+                self.send_space.set()
+            if len(self.send_queue):
+                self.send_ready.set()
 
     async def start(self):
-        """ Start the IRC connection. """
-        if not hasattr(self, 'irc_reader') or not hasattr(self, 'irc_writer'):
-            self.logger.info("Initializing connection.")
-            await self.connection_init()
+        """
+        Start the IRC connection.
+        If the connection drops, reconnects with jittered exponential backoff until stop() is called.
+        Channels, scrollback and server_info are kept across reconnects.
+        """
+        self.loop = asyncio.get_running_loop()
+        if self.metrics_port and not self.metrics_server:
+            from .metrics import serve_metrics
+            self.metrics_server = await serve_metrics(self.metrics, self.config.get('metrics_host', '127.0.0.1'), self.metrics_port)
+            self.logger.info("Serving metrics on port: %d" % self.metrics_port)
+        while not self.stopped.is_set():
+            if not hasattr(self, 'irc_reader') or not hasattr(self, 'irc_writer'):
+                self.logger.info("Initializing connection.")
+                self.connect_time = monotonic()
+                try:
+                    await self.connection_init()
+                except OSError as e:
+                    if not self.reconnect:
+                        raise
+                    self.logger.error("Failed to connect to %s: %s" % (self.config['server'], e))
+                    await self.reconnect_wait()
+                    continue
+
+            self.connects += 1
+            await self.run_connection()
+            if self.stopped.is_set() or not self.reconnect:
+                break
+            self.reset_connection()
+            await self.reconnect_wait()
+        if self.connects:
+            self.save_session()
+        if self.metrics_server:
+            self.metrics_server.close()
+            self.metrics_server = None
+        self.executor.shutdown()
+        if self.recorder:
+            self.recorder.close()
+        for channel in (*self.channels.values(), *self._channels.values()):
+            channel['messages'].close()
 
-        asyncio.create_task(self.reader_loop())
+    async def run_connection(self):
+        """
+        Runs the reader, writer, inbound and keepalive tasks for a connection, until it is closed.
+        If any of them fails, the error is logged and the connection is dropped, so it reconnects.
+        """
+        tasks = [asyncio.create_task(self.reader_loop()),
+                 asyncio.create_task(self.writer_loop()),
+                 asyncio.create_task(self.inbound_loop())]
+        if self.ping_interval:
+            tasks.append(asyncio.create_task(self.keepalive_loop()))
+        closed = asyncio.create_task(self.reader_done.wait())
         self.connection_setup()
 
-        await self.reader_done.wait()
+        done, _ = await asyncio.wait([*tasks, closed], return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task is not closed and not task.cancelled() and (e := task.exception()):
+                self.logger.error("Connection task %s failed: %s", task.get_coro().__qualname__, e, exc_info=e)
+        if not self.reader_done.is_set():
+            self.connection_lost()
+        for task in (*tasks, closed):
+            task.cancel()
+
+    async def keepalive_loop(self):
+        """
+        Sends a PING after ping_interval seconds without receiving anything,
+        and drops the connection if nothing arrives for ping_timeout seconds after that, so half-open connections reconnect.
+        """
+        pinged = False
+        while True:
+            silence = monotonic() - self.last_received
+            if silence >= self.ping_interval + self.ping_timeout:
+                self.logger.warning("No data received for %.0fs, dropping the connection.", silence)
+                return self.connection_lost()
+            if silence >= self.ping_interval:
+                if not pinged:
+                    self.ping(self.config['server'])
+                    pinged = True
+                await asyncio.sleep(self.ping_interval + self.ping_timeout - silence)
+            else:
+                pinged = False
+                await asyncio.sleep(self.ping_interval - silence)
+
+    def backoff(self):
+        """ Returns the delay before the next connection attempt, with jitter. """
+        delay = min(self.reconnect_delay * 2 ** self.reconnect_attempts, self.reconnect_max_delay)
+        return uniform(delay / 2, delay)
+
+    async def reconnect_wait(self):
+        """ Waits before reconnecting, returning early if stop() is called. """
+        delay = self.backoff()
+        self.reconnect_attempts += 1
+        self.metrics.inc('reconnects_total')
+        self.logger.warning("Reconnecting to %s in %.1fs (attempt %d)." % (self.config['server'], delay, self.reconnect_attempts))
+        try:
+            await asyncio.wait_for(self.stopped.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def call_threadsafe(self, func, *args):
+        """ Runs func in the client's event loop, for use from other threads such as the GUI. """
+        if self.loop is None:
+            return func(*args)  # The loop has not started, so nothing else is using the client
+        self.loop.call_soon_threadsafe(func, *args)
 
     def stop(self):
-        """ End the event loop. """
-        self.logger.info('Stopping event loop.')
-        asyncio.get_event_loop().stop()
+        """ Closes the connection and releases start() without reconnecting. """
+        self.logger.info('Stopping connection to: %s' % self.config['server'])
+        self.stopped.set()
+        self.connection_lost()
+
+    def connection_lost(self):
+        """ Closes the connection, start() reconnects unless stop() was called. """
+        if writer := getattr(self, 'irc_writer', None):
+            writer.close()
+        self.reader_done.set()
+
+    def reset_connection(self):
+        """ Drops the state of the current connection so a new one can be made. """
+        for attr in ('irc_reader', 'irc_writer'):
+            if hasattr(self, attr):
+                delattr(self, attr)
+        self.line_buffer.clear()
+        self.inbound.clear()
+        with self.send_lock:
+            self.send_queue.clear()
+            self.send_queue.bucket.reset()  # The server's flood limit starts over too
+        self.send_space.set()
+        self.reader_done.clear()
+        self.userhost = None
+        self.registered.clear()
+        self.ready.clear()
+        self.names_pending.clear()
+        self.names_stale.clear()
+        self.capabilities.clear()
+        self.batches.clear()
+        self.away_nicks.clear()
+        for channel in self.channels.values():
+            channel['joined'].clear()
+        self.members.clear()
 
     async def connection_init(self):
         """ Connects to the specified IRC server. """
-        self.irc_reader, self.irc_writer = await asyncio.open_connection(self.config['server'], self.config['port'], ssl=True)
+        self.irc_reader, self.irc_writer = await asyncio.open_connection(self.config['server'], self.config['port'],
+                                                                         ssl=self.config.get('ssl', True))
+        self.last_received = monotonic()
         self.logger.info('Connected to IRC server: %s:%d' % (self.config['server'], self.config['port']))
         self.logger.debug("Reader: %s, Writer: %s" % (self.irc_reader, self.irc_writer))
 
     def connection_setup(self):
-        """ Initializes the connection to the IRC server. """
+        """
+        Registers with the IRC server, channels are joined once registration completes.
+        If capabilities are configured, they are negotiated first.
+        """
+        if self.capabilities_wanted:
+            self.cap_start()
         self.user(self.config['user'])
         self.nick(self.config['user'])
-        self.server_info = {'supported_features': []}
 
-        self.logger.info("[%s] Supported features: %s" % (self.config['server'], self.server_info['supported_features']))
+    def on_registered(self):
+        """ Called by the 001 handler, joins configured channels and rejoins channels from before a reconnect. """
+        self.registered.set()
+        self.reconnect_attempts = 0
+        if self.connect_time is not None:
+            self.logger.info("[%s] Registered in %.3fs." % (self.config['server'], monotonic() - self.connect_time))
+        channels = list(self.config.get('channels', []))
+        channels += [channel for channel in self.channels if channel not in channels]
+        self.names_pending = {self.members.fold(channel) for channel in channels}
+        if channels:
+            self.join_channels(channels)
+            self.logger.info("[%s] Joining channels: %s" % (self.config['server'], ", ".join(channels)))
+        else:
+            self.on_ready()
+
+    def channel_ready(self, channel):
+        """ Called when a channel's NAMES list ends or its JOIN fails, the client is ready once every channel is done. """
+        self.names_pending.discard(self.members.fold(channel))
+        if not self.names_pending and self.registered.is_set():
+            self.on_ready()
+
+    def on_ready(self):
+        """ Called once registration and the NAMES lists of joined channels are done, saves the session cache. """
+        if self.ready.is_set():
+            return
+        self.ready.set()
+        if self.connect_time is not None:
+            self.startup_time = monotonic() - self.connect_time
+            self.logger.info("[%s] Joined and ready in %.3fs." % (self.config['server'], self.startup_time))
+        self.save_session()
 
-        for channel in self.config.get('channels'):
-            self.join(channel)
-            self.logger.info("[%s] Joined channel: %s" % (self.config['server'], channel))
+    def restore_session(self):
+        """
+        Fills server features, server_info, channels and members from the session cache.
+        Only channels which are still configured are restored, so parted or removed channels are not rejoined.
+        Cached members are replaced when the live NAMES list for their channel arrives.
+        """
+        self.cached_session = self.session_cache.get(self.config['server'])
+        if not self.cached_session:
+            return
+        self.isupport.restore(self.cached_session.get('isupport', {}))
+        self.members.set_prefix(self.isupport.prefix)
+        self.members.set_casemapping(self.isupport.casemapping)
+        self.server_info.update(self.cached_session.get('server_info', {}))
+        configured = {self.members.fold(channel) for channel in self.config.get('channels', [])}
+        channels = [channel for channel in self.cached_session.get('channels', []) if self.members.fold(channel) in configured]
+        for channel in channels:
+            self._track_channel(channel)
+        for channel, members in self.cached_session.get('members', {}).items():
+            if self.members.fold(channel) not in configured:
+                continue
+            for nick, modes in members.items():
+                self.members.add(channel, nick, modes)
+            self.names_stale.add(self.members.fold(channel))
+        self.logger.info("[%s] Restored session cache: %d channels, %d members." % (
+            self.config['server'], len(channels), len(self.members)))
+
+    def save_session(self):
+        """
+        Saves server features, server_info, joined channels and their members to the session cache.
+        Channel keys are not saved, configured keys are used when rejoining.
+        """
+        if not self.session_cache:
+            return
+        names = self.members.names
+        joined = [channel for channel, state in self.channels.items() if state['joined'].is_set()]
+        state = {'isupport': dict(self.isupport.tokens),
+                 'server_info': self.server_info,
+                 'channels': joined or list(self.cached_session.get('channels', [])),
+                 'members': {names[channel]: {names[nick]: modes for nick, modes in members.items()}
+                             for channel, members in self.members.channels.items()}}
+        try:
+            self.session_cache.save(self.config['server'], state)
+        except OSError as e:
+            self.logger.error("Failed to save session cache %s: %s" % (self.session_cache.path, e))
 
     async def process_line(self, line):
-        """ Processes a line from the IRC server. """
-        self.logger.debug('Processing line: %s' % line)
-        if handler := getattr(self, f'handle_{line.command}', None):
-            handler(line)
+        """ Processes a line from the IRC server, collecting lines which are part of a batch. """
+        self.lines_received += 1
+        if self.metrics.enabled:
+            self.metrics.inc('lines_received_total', line.command)
+        if self.logger.isEnabledFor(10):
+            self.logger.debug('Processing line: %s', line)
+        if line.tags and (ref := line.tags.get('batch')) in self.batches and line.command != 'BATCH':
+            return self.batches[ref].lines.append(line)
+        self.dispatch_line(line)
+
+    def dispatch_line(self, line):
+        """ Runs the handlers for a line. """
+        if handlers := self.handlers.get(line.command):
+            for handler in handlers:
+                handler(line)
         else:
-            self.logger.warning('[%s] Unhandled line: %s' % (line.command, line))
+            self.logger.warning('[%s] Unhandled line: %s', line.command, line)
 
-        if line.command in self.stop_cmd:
-            self.logger.warning('Received stop command: %s' % line.command)
+        if line.command in self.stop_cmd and (not line.source or line.hostmask.nickname == self.nickname):
+            self.logger.warning('Received stop command: %s', line.command)
             self.stop()
 
     async def reader_loop(self):
         """ Loop for the irc_reader. """
+        line_buffer, inbound = self.line_buffer, self.inbound
         while True:
-            data = await self.irc_reader.read(1024)
+            try:
+                data = await self.irc_reader.read(line_buffer.read_size)
+            except OSError as e:
+                self.logger.warning("Connection lost while reading: %s", e)
+                return self.connection_lost()
             if not data:
                 self.logger.warning("No data received, connection may have been closed.")
-                return self.stop()
+                return self.connection_lost()
+
+            if self.logger.isEnabledFor(5):
+                self.logger.log(5, 'Received data: %s', data)
+            if self.metrics.enabled:
+                self.metrics.inc('bytes_received_total', amount=len(data))
+            line_buffer.adapt(len(data))
+
+            received = self.last_received = monotonic()
+            for raw_line in line_buffer.push(data):
+                if raw_command(raw_line) in FAST_COMMANDS:
+                    # PINGs and registration skip the queue, so a burst can't get us pinged out or stall connecting
+                    if line := self.read_line(raw_line):
+                        try:
+                            await self.process_line(line)
+                        except Exception as e:
+                            self.logger.exception("Error processing line %s: %s", line, e)
+                else:
+                    inbound.push(raw_line, received)
+            if self.recorder:
+                self.recorder.flush()
+            if not inbound.space.is_set():
+                self.logger.debug("Inbound queue is full, pausing reads: %d lines", len(inbound))
+                await inbound.space.wait()
+
+    async def inbound_loop(self):
+        """
+        Processes the lines queued by the reader, yielding after each time slice so the reader and writer keep running.
+        During bursts, runs of JOIN, PART or QUIT lines from other users are applied together with process_churn.
+        """
+        inbound = self.inbound
+        while True:
+            if not inbound.queue:
+                if summary := inbound.end_burst():
+                    self.log_burst(summary)
+                inbound.ready.clear()
+                await inbound.ready.wait()
+
+            deadline = monotonic() + inbound.time_slice
+            run = []
+            while inbound.queue and monotonic() < deadline:
+                if not (line := self.read_line(inbound.pop())):
+                    continue
+                if inbound.bursting and self.collapsible(line):
+                    if run and run[0].command != line.command:
+                        self.flush_churn(run)
+                        run = []
+                    run.append(line)
+                    continue
+                if run:
+                    self.flush_churn(run)
+                    run = []
+                try:
+                    await self.process_line(line)
+                except Exception as e:
+                    self.logger.exception("Error processing line %s: %s", line, e)
+            if run:
+                self.flush_churn(run)
+            if self.recorder:
+                self.recorder.flush()
+            if self.metrics.enabled:
+                self.metrics.observe('inbound_delay_seconds', inbound.lag)
+            await asyncio.sleep(0)
 
-            self.logger.log(5, 'Received data: %s' % data)
-            lines = self.decoder.push(data)
-            if lines is None:
-                self.logger.warning("No lines returned from decoder, connection may have been closed.")
-                return self.stop()
+    def read_line(self, raw_line):
+        """ Tokenises and records a received line, returning None if it can't be tokenised. """
+        try:
+            line = tokenise_line(raw_line)
+        except (ValueError, IndexError) as e:
+            self.logger.warning("Unable to tokenise line %r: %s", raw_line, e)
+            return None
+        if self.recorder:
+            self.record_line(raw_line, line, self.recorder.INCOMING)
+        return line
 
+    def is_churn(self, line):
+        """ Checks if a line is a JOIN, PART or QUIT from another user which apply_churn can apply. """
+        return (line.command in self.churn_commands and line.source and (line.params or line.command == 'QUIT')
+                and self.members.fold(line.hostmask.nickname) != self.members.fold(self.nickname))
+
+    def collapsible(self, line):
+        """ Checks if a line is churn which process_churn can apply, outside of a batch. """
+        return self.is_churn(line) and not (line.tags and 'batch' in line.tags)
+
+    def flush_churn(self, lines):
+        """ Runs process_churn for a run of lines, logging errors so the inbound loop keeps running. """
+        try:
+            self.process_churn(lines)
+        except Exception as e:
+            self.logger.exception("Error processing %d %s lines: %s", len(lines), lines[0].command, e)
+
+    def process_churn(self, lines):
+        """
+        Counts a run of churn lines from a burst, and applies them with apply_churn.
+        Lines are not logged one by one, they are summarised when the burst ends.
+        """
+        command = lines[0].command
+        self.lines_received += len(lines)
+        if self.metrics.enabled:
+            self.metrics.inc('lines_received_total', command, len(lines))
+        self.inbound.count_churn(command, len(lines))
+        self.apply_churn(lines)
+
+    def apply_churn(self, lines):
+        """
+        Applies JOIN, PART or QUIT lines with the same command to the membership index at once,
+        in place of their base handlers, then runs any other handlers for each line.
+        """
+        command = lines[0].command
+        if command == 'JOIN':
+            self.members.add_many((line.params[0], line.hostmask.nickname) for line in lines)
+        elif command == 'PART':
+            self.members.remove_many((line.params[0], line.hostmask.nickname) for line in lines)
+        else:
+            nicks = [line.hostmask.nickname for line in lines]
+            self.members.quit_many(nicks)
+            if self.away_nicks:
+                self.away_nicks.difference_update(self.members.fold(nick) for nick in nicks)
+
+        base_handler = getattr(self, 'handle_' + command)
+        if handlers := [handler for handler in self.handlers.get(command, ()) if getattr(handler, '__wrapped__', handler) != base_handler]:
             for line in lines:
-                await self.process_line(line)
-        self.reader_done.set()
+                for handler in handlers:
+                    handler(line)
 
-    def loop_actions(self):
-        self.process_messages()
+    def log_burst(self, summary):
+        """ Logs one summary for a burst, in place of logging its churn line by line. """
+        churn = ", ".join("%d %s" % (count, command) for command, count in sorted(summary['churn'].items()))
+        self.logger.info("Processed a burst of %d lines in %.2fs, peak lag %.3fs%s" % (
+            summary['lines'], summary['seconds'], summary['peak_lag'], " (%s)" % churn if churn else ""))
+
+    def record_line(self, raw_line, line, direction):
+        """ Records a raw line, indexed by its channel and the nick which sent it. """
+        channel = line.params[0] if line.params and line.params[0][:1] in self.isupport.chantypes else None
+        if direction == self.recorder.OUTGOING:
+            nick = self.nickname
+        else:
+            nick = line.hostmask.nickname if line.source else None
+        self.recorder.record(raw_line, direction, channel and self.members.fold(channel), nick and self.members.fold(nick))
+
+    def messages(self, channel=None, pattern=None, maxsize=None, overflow=None):
+        """
+        Subscribes to received messages, optionally filtered by channel and a regex on the text.
+        Returns a MessageSubscription, use it with: async for msg in client.messages(channel='#chan')
+        """
+        subscription = MessageSubscription(self, channel, pattern,
+                                           maxsize or self.message_queue_size, overflow or self.message_overflow)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+
+    def publish_message(self, msg):
+        """ Hands a message to matching subscriptions, then to process_message. """
+        for subscription in list(self.subscriptions):  # Subscriptions may close while handling the message
+            if subscription.matches(msg):
+                subscription.put(msg)
+        self.process_message(msg)
+
+    def process_echo(self, msg):
+        """
+        Records our own message echoed back with echo-message in the channel's scrollback.
+        Echoes are not routed, published to subscriptions or passed to process_message, so bots can't trigger themselves.
+        """
+        if channel := self.channels.get(msg.params[0]):
+            channel['messages'].append(msg.hostmask.nickname, msg.params[1], message_time(msg))
 
     def process_message(self, msg):
-        """ Processes a message from the message queue. """
-        self.logger.debug('Processing message: %s' % msg)
+        """ Processes a received message. """
+        self.logger.debug('Processing message: %s', msg)
         print(f"[{msg.params[0]}] <{msg.source}> {msg.params[1]}")
 
-    def process_messages(self):
-        """ Processes messages from the message queue. """
-        while not self.message_queue.empty():
-            self.process_message(self.message_queue.get())
-
 
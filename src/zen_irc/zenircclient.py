@@ -1,4 +1,5 @@
-from zen_irc import ZenIRC
+from .zenirc import ZenIRC
+from .tags import message_time
 
 
 class ZenIRCClient(ZenIRC):
@@ -14,7 +15,14 @@ class ZenIRCClient(ZenIRC):
 
     def process_message(self, msg):
         channel = msg.params[0]
-        self.channels[channel]['messages'].append(msg)
+        if channel not in self.channels:
+            return self.logger.info("[%s] <%s> %s" % (channel, msg.source, msg.params[1]))
+        self.channels[channel]['messages'].append(msg.hostmask.nickname, msg.params[1], message_time(msg))
+        if self.update_signal:
+            self.update_signal.emit()
+
+    def process_echo(self, msg):
+        super().process_echo(msg)
         if self.update_signal:
             self.update_signal.emit()
 
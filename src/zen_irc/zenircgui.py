@@ -1,36 +1,65 @@
 from zenlib.logging import ClassLogger
 from .zenircclient import ZenIRCClient
 
-from PyQt6.QtWidgets import QMainWindow, QLabel, QLineEdit, QVBoxLayout, QWidget, QComboBox, QScrollArea
-# from PyQt6.QtCore import pyqtSignal, Qt, pyqtSlot, QTimer
-from PyQt6.QtCore import pyqtSignal, Qt
+from PyQt6.QtWidgets import QMainWindow, QLineEdit, QVBoxLayout, QWidget, QComboBox, QPlainTextEdit
+from PyQt6.QtCore import pyqtSignal, QTimer
+from threading import Thread
+import asyncio
+
+
+class ScrollbackView(QPlainTextEdit):
+    """
+    Read only view of a channel's scrollback.
+    Only appends entries which have not been rendered yet, and keeps at most max_lines blocks.
+    """
+    def __init__(self, max_lines=1000, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setReadOnly(True)
+        self.setMaximumBlockCount(max_lines)
+        self.scrollback = None
+        self.rendered = 0  # Sequence number of the next entry to render
+
+    def show_scrollback(self, scrollback):
+        """ Renders new entries from a scrollback, starting over if it is a different scrollback. """
+        if scrollback is not self.scrollback:
+            self.clear()
+            self.scrollback = scrollback
+            self.rendered = 0
+
+        if entries := scrollback.since(self.rendered):
+            self.appendPlainText("\n".join(f"{entry.nick}: {entry.text}" for entry in entries))
+            self.rendered = entries[-1].seq + 1
 
 
 class ZenIRCGUI(ClassLogger, QMainWindow):
+    """
+    Runs the client's event loop in an I/O thread, so Qt and the IRC connection run concurrently.
+    Calls into the client are handed to its loop with call_threadsafe,
+    and the client signals the GUI through update_signal, which Qt queues to the GUI thread.
+    """
     update_signal = pyqtSignal()
+    frame_interval = 33  # Milliseconds between coalesced updates
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, config="config.toml", *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.setWindowTitle("ZenIRC")
 
-        self.update_signal.connect(self.update_gui)
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(self.frame_interval)
+        self.update_timer.timeout.connect(self.update_gui)
+        self.update_signal.connect(self.schedule_update)
         self.channel_selector = QComboBox()
         self.channel_selector.currentIndexChanged.connect(self.update_channels)
 
-        display_box = QScrollArea()
-        display_box.setWidgetResizable(True)
-        self.display_label = QLabel()
-        self.display_label.setWordWrap(True)
-        self.display_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
-        self.display_label.setAlignment(Qt.AlignmentFlag.AlignBottom)
-        display_box.setWidget(self.display_label)
+        self.display = ScrollbackView()
 
         self.input_box = QLineEdit()
         self.input_box.returnPressed.connect(self.process_input)
 
         layout = QVBoxLayout()
         layout.addWidget(self.channel_selector)
-        layout.addWidget(display_box)
+        layout.addWidget(self.display)
         layout.addWidget(self.input_box)
 
         central_widget = QWidget()
@@ -38,7 +67,19 @@ class ZenIRCGUI(ClassLogger, QMainWindow):
         self.setCentralWidget(central_widget)
         self.show()
 
-        self.client = ZenIRCClient(logger=self.logger, update_signal=self.update_signal)
+        self.client = ZenIRCClient(config=config, logger=self.logger, update_signal=self.update_signal)
+        self.display.setMaximumBlockCount(self.client.scrollback_size)
+        self.client_thread = None
+
+    def start_client(self):
+        """ Starts the client's event loop in the I/O thread. """
+        self.client_thread = Thread(target=asyncio.run, args=(self.client.start(),), name="ZenIRC I/O", daemon=True)
+        self.client_thread.start()
+
+    def schedule_update(self):
+        """ Coalesces update signals, updating at most once per frame_interval. """
+        if not self.update_timer.isActive():
+            self.update_timer.start()
 
     def update_gui(self):
         self.update_channels()
@@ -48,13 +89,7 @@ class ZenIRCGUI(ClassLogger, QMainWindow):
         if not self.client.active_channel:
             return
         channel = self.client.channels.get(self.client.active_channel) or self.client._channels[self.client.active_channel]
-        label_text = ''
-        for message in channel['messages']:
-            if isinstance(message, str):
-                label_text += f"{self.client.nickname}: {message}\n"
-                continue
-            label_text += f"{message.hostmask.nickname}: {message.params[1]}\n"
-        self.display_label.setText(label_text)
+        self.display.show_scrollback(channel['messages'])
         self.channel_selector.setCurrentText(self.client.active_channel)
 
     def update_channels(self, channel=None):
@@ -63,7 +98,7 @@ class ZenIRCGUI(ClassLogger, QMainWindow):
             self.logger.info("Updated active channel: %s", self.client.active_channel)
             self.update_display()
 
-        for channel in self.client.channels:
+        for channel in list(self.client.channels):
             if self.channel_selector.findText(channel) == -1:
                 self.channel_selector.addItem(channel)
 
@@ -73,13 +108,15 @@ class ZenIRCGUI(ClassLogger, QMainWindow):
         if text.startswith('/'):
             cmd, *args = text[1:].split(' ')
             try:
-                getattr(self.client, cmd.lower())(*args)
+                self.client.call_threadsafe(getattr(self.client, cmd.lower()), *args)
             except AttributeError:
                 self.logger.error("Unknown command: %s", cmd)
         else:
-            self.client.msg(self.client.active_channel, text)
+            self.client.call_threadsafe(self.client.msg, self.client.active_channel, text)
         self.update_signal.emit()
 
     def closeEvent(self, event):
-        self.client.stop()
+        self.client.call_threadsafe(self.client.stop)
+        if self.client_thread:
+            self.client_thread.join(timeout=5)
         super().closeEvent(event)
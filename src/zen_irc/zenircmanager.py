@@ -0,0 +1,132 @@
+"""
+Runs many ZenIRC sessions on a single event loop.
+"""
+
+from zenlib.logging import ClassLogger
+
+from .zenirc import ZenIRC
+
+from time import monotonic
+import asyncio
+
+
+class SessionState:
+    """ Manager state for a single session, the session tracks its own reconnects. """
+    def __init__(self, name, session):
+        self.name = name
+        self.session = session
+        self.task = None
+        self.last_error = None
+        self.last_lines = 0
+
+    def __repr__(self):
+        return "<SessionState %s connects=%d attempts=%d>" % (
+            self.name, self.session.connects, self.session.reconnect_attempts)
+
+
+class ZenIRCManager(ClassLogger):
+    """
+    Hosts a ZenIRC session for every [networks.<name>] table in the config file.
+    Top level keys which are not tables are used as defaults for every network,
+    including the reconnect settings each session uses to reconnect on its own.
+    The [manager] table configures the manager itself.
+    """
+    def __init__(self, config="config.toml", session_class=ZenIRC, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config_file = config
+        self.session_class = session_class
+        self.load_config()
+
+        manager_config = self.config.get('manager', {})
+        self.connect_delay = manager_config.get('connect_delay', 0.5)
+        self.stats_interval = manager_config.get('stats_interval', 60)
+
+        self.sessions = {}
+        self.running = asyncio.Event()
+        self.lines_per_second = 0.0
+        self._last_stats = monotonic()
+
+    def load_config(self):
+        """ Loads the config file from self.config_file. """
+        from tomllib import load
+        self.logger.info('Loading manager config file: %s' % self.config_file)
+        with open(self.config_file, 'rb') as f:
+            self.config = load(f)
+
+        if not self.config.get('networks'):
+            raise ValueError("No [networks] defined in config file: %s" % self.config_file)
+
+    def session_config(self, name):
+        """ Returns the config for a network, with top level defaults applied. """
+        defaults = {key: value for key, value in self.config.items() if not isinstance(value, dict)}
+        return defaults | self.config['networks'][name]
+
+    def create_sessions(self):
+        """ Creates a session for every configured network which does not have one. """
+        for name in self.config['networks']:
+            if name in self.sessions:
+                continue
+            session = self.session_class(config=self.session_config(name), logger=self.logger.getChild(name))
+            self.sessions[name] = SessionState(name, session)
+            self.logger.debug("Created session for network: %s" % name)
+
+    async def start(self):
+        """ Starts all sessions, staggering connects by connect_delay. """
+        self.create_sessions()
+        self.running.set()
+        stats_task = asyncio.create_task(self.stats_loop())
+
+        for index, state in enumerate(self.sessions.values()):
+            if index and self.connect_delay:
+                await asyncio.sleep(self.connect_delay)
+            if not self.running.is_set():
+                break
+            state.task = asyncio.create_task(self.run_session(state))
+
+        await asyncio.gather(*[state.task for state in self.sessions.values() if state.task])
+        stats_task.cancel()
+
+    def stop(self):
+        """ Stops all sessions. """
+        self.logger.info('Stopping %d sessions.' % len(self.sessions))
+        self.running.clear()
+        for state in self.sessions.values():
+            state.session.stop()
+
+    async def run_session(self, state):
+        """ Runs a session until it is stopped, it reconnects on its own when the connection drops. """
+        try:
+            await state.session.start()
+        except Exception as e:
+            state.last_error = e
+            self.logger.exception("[%s] Session failed: %s" % (state.name, e))
+
+    def collect_stats(self):
+        """ Updates lines_per_second and returns per-session and aggregate stats. """
+        now = monotonic()
+        elapsed = (now - self._last_stats) or 1
+        self._last_stats = now
+
+        sessions = {}
+        total_lines = 0
+        for name, state in self.sessions.items():
+            lines = state.session.lines_received
+            sessions[name] = {'lines': lines,
+                              'lines_per_second': (lines - state.last_lines) / elapsed,
+                              'connects': state.session.connects,
+                              'attempts': state.session.reconnect_attempts,
+                              'metrics': state.session.metrics.snapshot()}
+            total_lines += lines - state.last_lines
+            state.last_lines = lines
+
+        self.lines_per_second = total_lines / elapsed
+        return {'sessions': sessions, 'lines_per_second': self.lines_per_second}
+
+    async def stats_loop(self):
+        """ Periodically logs the aggregate lines/sec handled by all sessions. """
+        while self.running.is_set():
+            await asyncio.sleep(self.stats_interval)
+            stats = self.collect_stats()
+            connected = sum(1 for state in self.sessions.values() if state.session.registered.is_set())
+            self.logger.info("Handling %.1f lines/sec across %d/%d sessions." % (
+                stats['lines_per_second'], connected, len(self.sessions)))
@@ -0,0 +1,57 @@
+from zen_irc.isupport import ISupport
+
+
+def test_defaults():
+    isupport = ISupport()
+    assert isupport.chantypes == '#&'
+    assert isupport.prefix == {'@': 'o', '+': 'v'}
+    assert isupport.casemapping == 'rfc1459'
+    assert isupport.max_targets('PRIVMSG') == 1
+    assert isupport.max_targets('JOIN', None) is None
+
+
+def test_update_and_remove():
+    isupport = ISupport()
+    isupport.update(['CHANTYPES=#', 'PREFIX=(qaohv)~&@%+', 'NETWORK=Example\\x20Net'])
+    assert isupport.chantypes == '#'
+    assert isupport.prefix['~'] == 'q'
+    assert isupport['NETWORK'] == 'Example Net'
+    isupport.update(['-CHANTYPES'])
+    assert 'CHANTYPES' not in isupport
+    assert isupport.chantypes == '#&'
+
+
+def test_casemapping():
+    isupport = ISupport()
+    assert isupport.casefold('Nick[]') == 'nick{}'
+    isupport.update(['CASEMAPPING=ascii'])
+    assert isupport.casefold('Nick[]') == 'nick[]'
+    isupport.update(['CASEMAPPING=strict-rfc1459'])
+    assert isupport.casefold('Nick[]~') == 'nick{}~'
+
+
+def test_targmax():
+    isupport = ISupport()
+    isupport.update(['TARGMAX=PRIVMSG:4,notice:3,JOIN:'])
+    assert isupport.targmax == {'PRIVMSG': 4, 'NOTICE': 3, 'JOIN': None}
+    assert isupport.max_targets('privmsg') == 4
+    assert isupport.max_targets('JOIN', 1) is None
+    assert isupport.max_targets('KICK', 1) == 1
+
+
+def test_maxtargets_fallback():
+    isupport = ISupport()
+    isupport.update(['MAXTARGETS=5'])
+    assert isupport.max_targets('NOTICE') == 5
+    assert isupport.max_targets('PART', 2) == 2
+    isupport.update(['TARGMAX=NOTICE:2'])
+    assert isupport.max_targets('NOTICE') == 2
+
+
+def test_parse_modes():
+    isupport = ISupport()
+    isupport.update(['CHANMODES=beI,k,l,imnpst', 'PREFIX=(ohv)@%+'])
+    assert isupport.parse_modes('+ov-k+lb', ['op', 'voice', 'key', '10', '*!*@host']) == [
+        (True, 'o', 'op'), (True, 'v', 'voice'), (False, 'k', 'key'), (True, 'l', '10'), (True, 'b', '*!*@host')]
+    assert isupport.parse_modes('-l+mh', ['halfop']) == [(False, 'l', None), (True, 'm', None), (True, 'h', 'halfop')]
+    assert isupport.parse_modes('+oo', ['one']) == [(True, 'o', 'one'), (True, 'o', None)]
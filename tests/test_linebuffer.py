@@ -0,0 +1,45 @@
+from zen_irc.linebuffer import LineBuffer
+
+
+def test_complete_lines():
+    assert LineBuffer().push(b'PING :a\r\nPING :b\r\n') == [b'PING :a', b'PING :b']
+
+
+def test_partial_line_kept():
+    buffer = LineBuffer()
+    assert buffer.push(b'PING :a\r\nPI') == [b'PING :a']
+    assert buffer.push(b'NG :b') == []
+    assert buffer.push(b'\r\n') == [b'PING :b']
+
+
+def test_split_line_ending():
+    buffer = LineBuffer()
+    assert buffer.push(b'PING :a\r') == []
+    assert buffer.push(b'\nPING :b\r\n') == [b'PING :a', b'PING :b']
+
+
+def test_bare_newlines_and_blank_lines():
+    assert LineBuffer().push(b'PING :a\nPING :b\r\n\r\n\nPING :c\n') == [b'PING :a', b'PING :b', b'PING :c']
+
+
+def test_clear():
+    buffer = LineBuffer()
+    buffer.push(b'PING :partial')
+    buffer.clear()
+    assert buffer.push(b'PING :a\r\n') == [b'PING :a']
+
+
+def test_read_size_grows_and_shrinks():
+    buffer = LineBuffer(read_size=4096, min_read_size=1024, max_read_size=16384, shrink_after=2)
+    buffer.adapt(4096)
+    assert buffer.read_size == 8192
+    buffer.adapt(8192)
+    buffer.adapt(16384)
+    assert buffer.read_size == 16384
+    buffer.adapt(10)
+    assert buffer.read_size == 16384
+    buffer.adapt(10)
+    assert buffer.read_size == 8192
+    for _ in range(10):
+        buffer.adapt(10)
+    assert buffer.read_size == 1024
@@ -0,0 +1,79 @@
+from zen_irc.members import MembershipIndex
+
+
+def test_rfc1459_casefolding():
+    members = MembershipIndex()
+    members.add('#Chan[1]', 'Nick[a]')
+    assert members.is_member('#chan{1}', 'NICK{A}')
+    assert members.members('#CHAN[1]') == ['Nick[a]']
+    assert members.fold('A[]\\~') == 'a{}|^'
+
+
+def test_ascii_casemapping():
+    members = MembershipIndex('ascii')
+    members.add('#chan', 'nick[a]')
+    assert not members.is_member('#chan', 'nick{a}')
+    assert members.is_member('#CHAN', 'NICK[A]')
+
+
+def test_set_casemapping_refolds():
+    members = MembershipIndex('ascii')
+    members.add('#chan', 'nick[a]', 'o')
+    members.set_casemapping('rfc1459')
+    assert members.is_member('#chan', 'nick{a}')
+    assert members.modes('#chan', 'NICK{A}') == 'o'
+
+
+
+def test_set_mode_keeps_prefix_order():
+    members = MembershipIndex(prefix='(qov)~@+')
+    members.add('#chan', 'Nick')
+    members.set_mode('#CHAN', 'nick', 'v')
+    members.set_mode('#chan', 'NICK', 'q')
+    members.set_mode('#chan', 'nick', 'o')
+    assert members.modes('#chan', 'nick') == 'qov'
+    members.set_mode('#chan', 'nick', 'o', adding=False)
+    assert members.modes('#chan', 'nick') == 'qv'
+    members.set_mode('#chan', 'absent', 'o')
+    assert not members.is_member('#chan', 'absent')
+
+
+def test_add_names():
+    members = MembershipIndex()
+    members.add_names('#chan', ['@+op!user@host', '+voice', 'plain', ''])
+    assert members.modes('#chan', 'op') == 'ov'
+    assert members.modes('#chan', 'voice') == 'v'
+    assert members.modes('#chan', 'plain') == ''
+    assert len(members) == 3
+
+
+def test_remove_forgets_nick_without_channels():
+    members = MembershipIndex()
+    members.add('#a', 'nick')
+    members.add('#b', 'nick')
+    members.remove('#a', 'NICK')
+    assert members.channels_of('nick') == ['#b']
+    members.remove('#b', 'nick')
+    assert members.channels_of('nick') == []
+    assert 'nick' not in members.nicks
+
+
+def test_quit_and_remove_channel():
+    members = MembershipIndex()
+    members.add('#a', 'one')
+    members.add('#b', 'one')
+    members.add('#b', 'two')
+    assert sorted(members.quit('One')) == ['#a', '#b']
+    assert members.members('#b') == ['two']
+    members.remove_channel('#B')
+    assert len(members) == 0
+    assert members.channels_of('two') == []
+
+
+def test_rename_keeps_modes():
+    members = MembershipIndex()
+    members.add('#a', 'old', 'o')
+    members.rename('OLD', 'New')
+    assert members.modes('#a', 'new') == 'o'
+    assert members.members('#a') == ['New']
+    assert not members.is_member('#a', 'old')
@@ -0,0 +1,80 @@
+from zen_irc.ratelimit import TokenBucket, OutboundScheduler
+
+
+def pushed(scheduler, *entries):
+    for command, target, data in entries:
+        scheduler.push(command, target, data)
+    return scheduler
+
+
+def popped(scheduler):
+    return [data for data, _ in scheduler.pop()]
+
+
+def test_protocol_lane_first():
+    scheduler = pushed(OutboundScheduler(10, 0), ('PRIVMSG', '#a', b'message'), ('NICK', 'nick', b'nick'), ('PONG', 'server', b'pong'))
+    assert popped(scheduler)[0] == b'pong'
+    assert len(scheduler) == 0
+
+
+def test_messages_round_robin_across_targets():
+    scheduler = pushed(OutboundScheduler(10, 0), ('PRIVMSG', '#a', b'a1'), ('PRIVMSG', '#a', b'a2'), ('PRIVMSG', '#a', b'a3'),
+                       ('PRIVMSG', '#b', b'b1'), ('NOTICE', '#c', b'c1'))
+    assert popped(scheduler) == [b'a1', b'b1', b'c1', b'a2', b'a3']
+
+
+
+def test_command_waits_for_older_messages_only():
+    scheduler = pushed(OutboundScheduler(3, 0), ('PRIVMSG', '#a', b'm1'), ('PRIVMSG', '#a', b'm2'),
+                       ('MODE', '#b', b'mode'), ('PRIVMSG', '#b', b'm3'))
+    assert popped(scheduler) == [b'm1', b'm2', b'mode', b'm3']
+
+
+def test_newer_messages_wait_for_command():
+    scheduler = pushed(OutboundScheduler(burst=3, rate=0.001), ('PRIVMSG', '#a', b'm1'), ('PRIVMSG', '#a', b'm2'),
+                       ('MODE', '#b', b'mode'), ('PRIVMSG', '#b', b'm3'))
+    assert popped(scheduler) == [b'm1', b'm2', b'mode']
+
+
+def test_bucket_limits_burst():
+    scheduler = OutboundScheduler(burst=2, rate=0.001)
+    for number in range(5):
+        scheduler.push('PRIVMSG', '#a', b'%d' % number)
+    assert popped(scheduler) == [b'0', b'1']
+    assert popped(scheduler) == []
+    assert len(scheduler) == 3
+    assert scheduler.next_delay() > 0
+
+
+
+def test_bucket_reset_refills():
+    bucket = TokenBucket(burst=3, rate=0.001)
+    bucket.take(3)
+    assert bucket.available() == 0
+    bucket.reset()
+    assert bucket.available() == 3
+
+
+def test_rate_zero_is_unlimited():
+    bucket = TokenBucket(burst=1, rate=0)
+    bucket.take(100)
+    assert bucket.available() == float('inf')
+    assert bucket.delay() == 0
+
+
+def test_empty_queue():
+    scheduler = OutboundScheduler()
+    assert popped(scheduler) == []
+    assert scheduler.next_delay() is None
+
+
+def test_clear_and_stats():
+    scheduler = pushed(OutboundScheduler(10, 0), ('PONG', 's', b'pong'), ('JOIN', '#a', b'join'), ('PRIVMSG', '#a', b'message'))
+    assert scheduler.stats()['protocol'] == 1
+    assert scheduler.stats()['commands'] == 1
+    assert scheduler.stats()['messages'] == 1
+    popped(scheduler)
+    assert scheduler.stats()['sent'] == 3
+    pushed(scheduler, ('PRIVMSG', '#a', b'message'))
+    scheduler.clear()
+    assert len(scheduler) == 0
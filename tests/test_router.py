@@ -0,0 +1,85 @@
+from zen_irc.router import Router, required_literal
+
+from re import compile
+
+
+class Message:
+    """ Stands in for a tokenised PRIVMSG. """
+    def __init__(self, text, channel='#chan', source='nick!user@host.example.net'):
+        self.source = source
+        self.params = [channel, text]
+
+
+def test_required_literal():
+    assert required_literal(compile(r'\bkeyword\d+')) == 'keyword'
+    assert required_literal(compile(r'https?://\S+')) == 'http'
+    assert required_literal(compile(r'Hello World')) == 'hello world'
+    assert required_literal(compile(r'abc[xyz]defg')) == 'defg'
+    assert required_literal(compile(r'one|two')) == ''
+    assert required_literal(compile(r'(?:maybe)?x')) == 'x'
+
+
+def test_required_literal_escapes():
+    assert required_literal(compile(r'\x41BCD')) == 'bcd'
+    assert required_literal(compile(r'caf\u00e9s')) == 'caf'
+    assert required_literal(compile(r'\N{BULLET} item')) == ' item'
+    assert required_literal(compile(r'(a)\1 and more')) == ' and more'
+    assert required_literal(compile(r'\0123 abc')) == '3 abc'
+    assert required_literal(compile(r'\101 abc')) == ' abc'
+    assert required_literal(compile(r'\.com')) == '.com'
+
+
+def test_escape_not_dropped_by_prefilter():
+    router, calls = Router(), []
+    router.add(lambda msg, args: calls.append(args), regex=r'\x41BCD')
+    router.compile()
+    assert router.route(Message('say ABCD now')) == 1
+    assert router.route(Message('say BCD now')) == 0
+    assert len(calls) == 1
+
+
+def test_commands_and_arguments():
+    router, calls = Router(), []
+    router.add(lambda msg, args: calls.append(('ping', args)), command='ping')
+    router.add(lambda msg, args: calls.append(('hi', args)), startswith='hello')
+    assert router.route(Message('!ping some args')) == 1
+    assert router.route(Message('!pingx')) == 0
+    assert router.route(Message('!ping')) == 1
+    assert router.route(Message('hellothere')) == 1
+    assert calls == [('ping', 'some args'), ('ping', ''), ('hi', 'there')]
+    assert len(router) == 2
+
+
+def test_earliest_regex_wins():
+    router, calls = Router(), []
+    router.add(lambda msg, match: calls.append('late'), regex=r'\bzebra\b')
+    router.add(lambda msg, match: calls.append('early'), regex=r'\bapple\b')
+    router.add(lambda msg, match: calls.append('any'), regex=r'\d{3}')
+    assert router.route(Message('an apple and a zebra')) == 1
+    assert router.route(Message('zebra then apple')) == 1
+    assert router.route(Message('call 555 apple')) == 1
+    assert router.route(Message('nothing here')) == 0
+    assert calls == ['early', 'late', 'any']
+
+
+def test_prefilter_matches_search():
+    patterns = [r'\bkeyword\d+', r'(?i)CaSe', r'https?://\S+', r'a.c', r'x{2,}y']
+    texts = ['keyword12 here', 'no keyword', 'case', 'see http://example.net', 'abc', 'xxy', 'xy', '']
+    router = Router()
+    for pattern in patterns:
+        router.add(lambda msg, match: None, regex=pattern)
+    router.compile()
+    for text in texts:
+        expected = sorted(index for index, pattern in enumerate(patterns) if compile(pattern).search(text))
+        assert set(expected) <= set(router.candidates(text)), text
+
+
+def test_channel_and_hostmask_filters():
+    router, calls = Router(), []
+    router.add(lambda msg, args: calls.append('chan'), command='a', channel='#Chan')
+    router.add(lambda msg, args: calls.append('host'), command='b', hostmask='*!*@*.example.net')
+    router.route(Message('!a', channel='#chan'))
+    router.route(Message('!a', channel='#other'))
+    router.route(Message('!b', source='nick!user@trusted.example.net'))
+    router.route(Message('!b', source='nick!user@elsewhere.org'))
+    assert calls == ['chan', 'host']
@@ -0,0 +1,29 @@
+from zen_irc.tags import LazyTags, unescape_tag
+
+
+def test_unescape():
+    assert unescape_tag('a\\sb\\:c\\\\d') == 'a b;c\\d'
+    assert unescape_tag('trailing\\') == 'trailing'
+
+
+def test_parsed_on_use():
+    tags = LazyTags('time=2024-01-01T00:00:00Z;msgid=abc;flag')
+    assert tags._parsed is None
+    assert tags['msgid'] == 'abc'
+    assert tags['flag'] == ''
+    assert len(tags) == 3
+
+
+def test_absent_tags_not_parsed():
+    tags = LazyTags('time=2024-01-01T00:00:00Z;msgid=abc')
+    assert tags
+    assert 'batch' not in tags
+    assert tags.get('batch') is None
+    assert tags._parsed is None
+    assert 'msgid' in tags
+    assert 'msg' not in tags
+
+
+def test_empty_tags_falsy():
+    assert not LazyTags('')
+    assert LazyTags('')._parsed is None
@@ -0,0 +1,115 @@
+from zen_irc.targets import LINE_LIMIT, pack_targets, pack_joins, split_text, merge_commands
+
+import pytest
+
+
+def line_length(command, params):
+    """ Length of a line as it is sent, with the last parameter as a trailing parameter. """
+    return len((command + ' ' + ' '.join(params[:-1] + [':' + params[-1]]) + '\r\n').encode())
+
+
+def test_join_keyed_channels_first():
+    assert pack_joins([('#a', None), ('#b', 'key_b'), ('#c', None), ('#d', 'key_d')]) == [['#b,#d,#a,#c', 'key_b,key_d']]
+
+
+def test_join_without_keys():
+    assert pack_joins([('#a', None), ('#b', None)]) == [['#a,#b']]
+
+
+def test_join_duplicates_keep_first_key():
+    assert pack_joins([('#a', 'first'), ('#b', None), ('#a', 'second'), ('#a', None)]) == [['#a,#b', 'first']]
+
+
+def test_join_targmax():
+    assert pack_joins([('#a', 'k'), ('#b', None), ('#c', None)], max_targets=2) == [['#a,#b', 'k'], ['#c']]
+
+
+def test_join_line_limit_counts_keys():
+    channels = [('#channel%03d' % number, 'key%03d' % number) for number in range(100)]
+    packed = pack_joins(channels)
+    assert len(packed) > 1
+    for params in packed:
+        assert len(('JOIN ' + ' '.join(params) + '\r\n').encode()) <= LINE_LIMIT
+        assert len(params[0].split(',')) == len(params[1].split(','))
+    assert [channel for params in packed for channel in params[0].split(',')] == [channel for channel, _ in channels]
+
+
+def test_join_channel_too_long():
+    with pytest.raises(ValueError):
+        pack_joins([('#' + 'a' * LINE_LIMIT, None)])
+
+
+def test_targets_targmax():
+    assert pack_targets('PRIVMSG', ['#a', '#b', '#c'], ['hi'], max_targets=2) == [['#a', '#b'], ['#c']]
+    assert pack_targets('PRIVMSG', ['#a', '#b', '#c'], ['hi'], max_targets=None) == [['#a', '#b', '#c']]
+
+
+def test_targets_duplicates():
+    assert pack_targets('PART', ['#a', '#b', '#a']) == [['#a', '#b']]
+
+
+def test_targets_multibyte_line_limit():
+    text = 'é' * 10  # 20 bytes
+    limit = line_length('PRIVMSG', ['#aa', text])
+    assert pack_targets('PRIVMSG', ['#aa', '#bb'], [text], line_limit=limit) == [['#aa'], ['#bb']]
+    assert pack_targets('PRIVMSG', ['#aa', '#bb'], [text], line_limit=limit + 4) == [['#aa', '#bb']]
+
+
+def test_targets_text_too_long():
+    with pytest.raises(ValueError):
+        pack_targets('PRIVMSG', ['#a'], ['x' * 520])
+
+
+def test_split_short_text():
+    assert split_text('PRIVMSG', '#a', 'hello') == ['hello']
+    assert split_text('PRIVMSG', '#a', '') == ['']
+
+
+def test_split_at_spaces():
+    text = ' '.join('word%03d' % number for number in range(200))
+    chunks = split_text('PRIVMSG', '#a', text)
+    assert len(chunks) > 1
+    assert ' '.join(chunks) == text
+    for chunk in chunks:
+        assert line_length('PRIVMSG', ['#a', chunk]) <= LINE_LIMIT
+        assert chunk.startswith('word')
+
+
+def test_split_multibyte_without_spaces():
+    text = 'é中' * 300
+    chunks = split_text('PRIVMSG', '#a', text)
+    assert ''.join(chunks) == text
+    for chunk in chunks:
+        assert line_length('PRIVMSG', ['#a', chunk]) <= LINE_LIMIT
+    assert pack_targets('PRIVMSG', ['#a'], [chunks[0]]) == [['#a']]
+
+
+def test_split_reserves_relay_prefix():
+    text = 'x' * 600
+    prefix = ':nick!~user@host.example.net '
+    for chunk in split_text('PRIVMSG', '#a', text, reserved=len(prefix)):
+        assert len(prefix) + line_length('PRIVMSG', ['#a', chunk]) <= LINE_LIMIT
+    assert len(split_text('PRIVMSG', '#a', 'x' * 490)) == 1
+    assert len(split_text('PRIVMSG', '#a', 'x' * 490, reserved=len(prefix))) == 2
+
+
+def test_targets_reserve_relay_prefix():
+    limit = line_length('PRIVMSG', ['#aa,#bb', 'hi'])
+    assert pack_targets('PRIVMSG', ['#aa', '#bb'], ['hi'], line_limit=limit) == [['#aa', '#bb']]
+    assert pack_targets('PRIVMSG', ['#aa', '#bb'], ['hi'], line_limit=limit, reserved=3) == [['#aa'], ['#bb']]
+
+
+def test_split_target_too_long():
+    with pytest.raises(ValueError):
+        split_text('PRIVMSG', '#' + 'a' * LINE_LIMIT, 'hi')
+
+
+def test_merge_commands():
+    commands = [('JOIN', '#a', None), ('JOIN', '#b', 'key'),
+                ('PRIVMSG', '#a', 'hi'), ('PRIVMSG', '#b', 'hi'), ('PRIVMSG', '#a', 'hi'), ('PRIVMSG', '#b', 'bye'),
+                ('PART', '#a', None)]
+    assert merge_commands(commands) == [('JOIN', [('#a', None), ('#b', 'key')]),
+                                        ('PRIVMSG', [('#a', 'hi'), ('#b', 'hi')]),
+                                        ('PRIVMSG', [('#a', 'hi')]),
+                                        ('PRIVMSG', [('#b', 'bye')]),
+                                        ('PART', [('#a', None)])]